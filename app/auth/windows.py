@@ -10,6 +10,7 @@ from sqlalchemy.orm import Session
 
 from app.config import secret_key, logger
 from app.system.models import engine, User, UserRole
+from app.system.instrumentation import track_operation
 
 
 class SessionManager:
@@ -54,7 +55,8 @@ def login_required(func):
             return None  # Or redirect, or raise error
 
         # If check passes, execute the original function
-        return func(*args, **kwargs)
+        with track_operation(func.__name__):
+            return func(*args, **kwargs)
 
     return wrapper
 
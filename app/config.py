@@ -38,15 +38,44 @@ secret_key = '85015f158b2f8b050705aa6ec9fbd65c99966725eec0965a5ac0bd3564afd210'
 
 
 
+# Settings for the SQLite engine, see app.system.models.create_db_engine.
+# cache_size is in KiB and mmap_size in bytes, busy_timeout in milliseconds.
+default_database_config = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': 64000,
+    'mmap_size': 268435456,
+    'busy_timeout': 10000,
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_recycle': 3600,
+    # The SQL editor can query a copy of the database that is refreshed when it is older than snapshot_max_age seconds.
+    'snapshot_path': 'labtycoon-snapshot.db',
+    'snapshot_max_age': 300,
+}
+
+# Analyzer pools of the analysis simulation, see app.system.simulation.routing. Each pool is a dictionary
+# with a name, the number of instruments (count), the run time of one batch in minutes (min_duration and
+# max_duration), the number of items run together (batch_size) and the test methods and codes it runs.
+# Tests go to the pool listing their code, then their method, then the first pool without methods or codes.
+# When the list is empty, all tests run on num_analyzers identical analyzers.
+default_analyzers_config = []
+
 if not os.path.exists('config.yaml'):
     config_dict = {
         'num_analyzers': 1,
+        'database': dict(default_database_config),
+        'analyzers': list(default_analyzers_config),
     }
     with open('config.yaml', 'w') as f:
         yaml.dump(config_dict, f)
 else:
     with open('config.yaml', 'r') as f:
-        config_dict = yaml.safe_load(f)
+        config_dict = yaml.safe_load(f) or {}
+
+# Config files written by older versions do not have the database section.
+config_dict['database'] = {**default_database_config, **config_dict.get('database', {})}
+config_dict.setdefault('analyzers', list(default_analyzers_config))
 
 
 def update_config_yaml(**kwargs):
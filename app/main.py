@@ -10,7 +10,7 @@ from app.auth.windows import (create_signin_window,
                               create_profile_window,
                               create_register_window,
                               create_user_list_window)
-from app.system.models import initialize_db
+from app.system.models import initialize_db, migrate_db
 from app.config import secret_key
 from app.auth.windows import SessionManager
 from app.system.windows import *
@@ -34,13 +34,15 @@ if any(platform.win32_ver()):
 if not os.path.exists('labtycoon.db'):
     print('database not exists.. in ' + 'labtycoon.db')
     initialize_db()
+else:
+    migrate_db()
 
 sg.theme('SystemDefault')
 sg.set_options(font=('Helvetica', 12))
 menu_def = [
     ['Users', ['Register', 'Manage']],
     ['Tests', ['List']],
-    ['Tools', ['SQL Editor']],
+    ['Tools', ['SQL Editor', 'Performance', 'Capacity Planning']],
     ['About', ['Program']],
 ]
 
@@ -133,6 +135,10 @@ def run_app():
                         , title='About')
         elif event == 'SQL Editor' or event == '-SQL-EDITOR-':
             create_sql_window()
+        elif event == 'Performance':
+            create_performance_window()
+        elif event == 'Capacity Planning':
+            create_capacity_window()
         elif event == '-ANALYZE-':
             create_analysis_window()
         elif event == '-ORDERS-':
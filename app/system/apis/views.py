@@ -1,16 +1,29 @@
+import collections
+import csv
 import datetime
+import io
+import json
 import logging
-from functools import wraps
+import math
 import random
+import threading
+from functools import wraps
 
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
+from werkzeug.http import http_date, quote_etag
 from werkzeug.security import check_password_hash
 from http import HTTPStatus
 from flask_jwt_extended import jwt_required, get_jwt_identity, current_user, verify_jwt_in_request, get_jwt
-from sqlalchemy import func
+from sqlalchemy.orm import selectinload, joinedload
 from sqlalchemy.exc import IntegrityError
 
-from system.models import User, UserRole, BioSource, Test, Specimens, TestMethod, Customer, LabOrder, LabOrderItem
+from app.system.queries import (encode_cursor, decode_order_cursor, decode_id_cursor, order_api_rows_query,
+                                order_item_rows_query, customer_rows_query, to_json_row)
+from app.system.simulation.orders import generate_orders
+from app.system.simulation.analysis import analyze_pending_items
+from app.system.jobs import submit_job, get_job, JobQueueFull
+from app.system.versions import table_versions
+from app.system.models import User, UserRole, BioSource, Test, Specimens, TestMethod, LabOrder, LabOrderItem
 from flask_restful import Resource
 
 from ..extensions import db
@@ -18,6 +31,206 @@ from ..extensions import db
 logger = logging.getLogger('client')
 
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BULK_ITEMS = 1000
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# Upper limits of the job parameters, a job builds all its orders in memory.
+MAX_JOB_PARAMS = {'num_orders': 10000, 'num_staff': 100, 'num_analyzers': 100}
+
+# Tables each cached list is built from, see cached_response.
+TEST_TABLES = ('tests', 'test_methods', 'specimens')
+CUSTOMER_TABLES = ('customers',)
+USER_TABLES = ('users', 'roles', 'user_roles')
+MAX_CACHED_RESPONSES = 256
+
+_response_cache = collections.OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def cached_response(tables, build):
+    """Return the data of build() with the ETag and Last-Modified of the tables.
+
+    The data is cached per URL until one of the tables changes. Requests with a
+    matching If-None-Match get 304 Not Modified without building the data.
+    If-Modified-Since is not used because HTTP dates have a resolution of one
+    second, so a change made in the same second as the response would be missed.
+    """
+    etag, last_modified = table_versions(db.session, *tables)
+    headers = {'ETag': quote_etag(etag), 'Cache-Control': 'no-cache'}
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+    if request.if_none_match and request.if_none_match.contains(etag):
+        return '', HTTPStatus.NOT_MODIFIED, headers
+    key = request.full_path
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+    if cached and cached[0] == etag:
+        data = cached[1]
+    else:
+        # The versions were read before building, so data committed meanwhile is built again next time.
+        data = build()
+        with _response_cache_lock:
+            _response_cache[key] = (etag, data)
+            _response_cache.move_to_end(key)
+            while len(_response_cache) > MAX_CACHED_RESPONSES:
+                _response_cache.popitem(last=False)
+    return data, HTTPStatus.OK, headers
+
+
+def get_page_args():
+    """Return the page size and cursor of a keyset paginated list request.
+
+    Clients pass the next_cursor of the previous response to get the next page.
+    """
+    page_size = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    if not 0 < page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return page_size, request.args.get('cursor')
+
+
+def get_list_arg(name):
+    """Return the comma separated values of a query string argument as a list, or None."""
+    value = request.args.get(name)
+    return [v.strip() for v in value.split(',') if v.strip()] if value else None
+
+
+def get_date_arg(name):
+    """Return an ISO date or datetime query string argument as a datetime, or None."""
+    value = request.args.get(name)
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def get_order_filters():
+    """Return the filters of the order list arguments as keyword arguments of order_api_rows_query."""
+    statuses = get_list_arg('status')
+    return {
+        'statuses': [status.upper() for status in statuses] if statuses else None,
+        'start': get_date_arg('start'),
+        'end': get_date_arg('end'),
+    }
+
+
+def get_order_item_filters():
+    """Return the filters of the order item list arguments as keyword arguments of order_item_rows_query.
+
+    unfinished=true is kept for older clients and is the same as status=pending.
+    """
+    statuses = get_list_arg('status')
+    if request.args.get('unfinished') == 'true':
+        statuses = (statuses or []) + ['pending']
+    return {
+        'statuses': statuses,
+        'start': get_date_arg('start'),
+        'end': get_date_arg('end'),
+        'date_field': request.args.get('date_field', 'received_at'),
+        'test_codes': get_list_arg('code'),
+        'hns': get_list_arg('hn'),
+    }
+
+
+def parse_item_value(value, test):
+    """Return the text of a result value for the test.
+
+    Raises ValueError when it is not a number for a Quantitative test or not one
+    of the value choices of the test.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('value must be a string or a number.')
+    value = str(value).strip()
+    if not value:
+        return value
+    if test.scale == 'Quantitative':
+        try:
+            number = float(value)
+        except ValueError:
+            raise ValueError(f'value of {test.code} must be a number.')
+        if not math.isfinite(number):
+            raise ValueError(f'value of {test.code} must be a number.')
+    elif test.value_choices:
+        choices = [choice.strip() for choice in test.value_choices.split(',')]
+        if value not in choices:
+            raise ValueError(f'value of {test.code} must be one of {", ".join(choices)}.')
+    return value
+
+
+def parse_item_changes(entry, roles, test):
+    """Return the column values of a bulk order item change of an item of the test.
+
+    Raises PermissionError when the user lacks the reporter or approver role
+    it needs and ValueError when it is not valid.
+    """
+    unknown = set(entry) - {'id', 'value', 'comment', 'reported_at', 'approved_at'}
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+    if 'reported_at' in entry and 'reporter' not in roles:
+        raise PermissionError('Reporter role is required.')
+    if 'approved_at' in entry and 'approver' not in roles:
+        raise PermissionError('Approver role is required.')
+    changes = {}
+    for key in ('reported_at', 'approved_at'):
+        if key in entry:
+            try:
+                changes[key] = datetime.datetime.fromisoformat(entry[key])
+            except (TypeError, ValueError):
+                raise ValueError(f'{key} is not an ISO datetime.')
+    if 'value' in entry:
+        changes['_value'] = parse_item_value(entry['value'], test)
+    if 'comment' in entry:
+        if entry['comment'] is not None and not isinstance(entry['comment'], str):
+            raise ValueError('comment must be a string.')
+        changes['comment'] = entry['comment']
+    if not changes:
+        raise ValueError('There is nothing to change.')
+    return changes
+
+
+def export_response(query, filename):
+    """Stream the rows of query as NDJSON or CSV, chosen by the format argument.
+
+    The rows are fetched EXPORT_CHUNK_SIZE at a time from a server side cursor
+    and written to the response chunk by chunk, so the memory used does not
+    depend on the number of rows.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return {'message': f'format must be one of {", ".join(EXPORT_FORMATS)}'}, HTTPStatus.BAD_REQUEST
+
+    def generate():
+        with db.engine.connect() as conn:
+            result = conn.execution_options(yield_per=EXPORT_CHUNK_SIZE).execute(query)
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(result.keys())
+                for rows in result.partitions():
+                    writer.writerows(to_json_row(row).values() for row in rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+            else:
+                for rows in result.partitions():
+                    yield ''.join(json.dumps(to_json_row(row)) + '\n' for row in rows)
+
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename={filename}.{export_format}'})
+
+
+def load_page(query, page_size, last_id):
+    """Return the JSON rows of the page of an id sorted query after last_id and the next cursor."""
+    rows = db.session.execute(query.where(query.selected_columns.id > last_id).limit(page_size + 1)).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1].id)
+    return [to_json_row(row) for row in rows], next_cursor
+
+
 def admin_required():
     def wrapper(fn):
         @wraps(fn)
@@ -37,10 +250,7 @@ def admin_required():
 class AdminUserListResource(Resource):
     @admin_required()
     def get(self):
-        data = []
-        for user in User.query.all():
-            data.append(user.to_dict())
-        return {'data': data}
+        return cached_response(USER_TABLES, lambda: {'data': [user.to_dict() for user in User.query.all()]})
 
 
 class AdminUserRoleResource(Resource):
@@ -71,26 +281,53 @@ class AdminBioSource(Resource):
 class CustomerListResource(Resource):
     @jwt_required()
     def get(self):
-        customers = Customer.query.all()
-        return {'data': [c.to_dict() for c in customers]}, HTTPStatus.OK
+        """Return a page of customers, filtered by hn=HN1,HN2 and name=part of a name.
+
+        fields=hn,fullname returns only these fields and the id.
+        """
+        try:
+            page_size, cursor = get_page_args()
+            last_id = decode_id_cursor(cursor) if cursor else 0
+            query = customer_rows_query(get_list_arg('fields'), get_list_arg('hn'), request.args.get('name'))
+        except ValueError as e:
+            return {'message': f'Invalid parameters: {e}'}, HTTPStatus.BAD_REQUEST
+
+        def build():
+            data, next_cursor = load_page(query, page_size, last_id)
+            return {'data': data, 'next_cursor': next_cursor}
+
+        return cached_response(CUSTOMER_TABLES, build)
 
 
 class CustomerResource(Resource):
     @jwt_required()
     def get(self, customer_id):
-        customer = Customer.query.get(customer_id)
-        cust_data = customer.to_dict()
-        cust_data['orders'] = []
-        for order in customer.orders:
-            order_data = {
-                'id': order.id,
-                'received_at': order.received_at.isoformat(),
-                'items': [],
-            }
-            for item in order.order_items:
-                order_data['items'].append(item.to_dict())
-            cust_data['orders'].append(order_data)
+        """Return the customer with the items of their orders, grouped by order.
 
+        Filters: start and end (ISO dates, start <= received_at < end) and code=GLU,HBA1C.
+        latest=true returns the latest finished result of each test as latest_results instead.
+        """
+        try:
+            start, end = get_date_arg('start'), get_date_arg('end')
+        except ValueError as e:
+            return {'message': f'Invalid parameters: {e}'}, HTTPStatus.BAD_REQUEST
+        customer = db.session.execute(customer_rows_query(customer_id=customer_id)).one_or_none()
+        if not customer:
+            return {'message': 'Customer not found.'}, HTTPStatus.NOT_FOUND
+        latest = request.args.get('latest') == 'true'
+        query = order_item_rows_query(start=start, end=end, test_codes=get_list_arg('code'),
+                                      customer_id=customer_id, latest=latest)
+        items = [to_json_row(row) for row in db.session.execute(query)]
+        cust_data = to_json_row(customer)
+        if latest:
+            cust_data['latest_results'] = sorted(items, key=lambda item: item['code'])
+        else:
+            orders = {}
+            for item in items:
+                if item['order_id'] not in orders:
+                    orders[item['order_id']] = {'id': item['order_id'], 'received_at': item['received_at'], 'items': []}
+                orders[item['order_id']]['items'].append(item)
+            cust_data['orders'] = sorted(orders.values(), key=lambda order: order['id'])
         return {'data': cust_data}, HTTPStatus.OK
 
 
@@ -154,8 +391,12 @@ class UserResource(Resource):
 class TestListResource(Resource):
     @jwt_required()
     def get(self):
-        data = [d.to_dict() for d in Test.query.filter_by(active=True)]
-        return {'data': data, 'message': 'Done'}, HTTPStatus.OK
+        def build():
+            tests = Test.query.filter_by(active=True).options(selectinload(Test.specimens),
+                                                               selectinload(Test.method))
+            return {'data': [test.to_dict() for test in tests], 'message': 'Done'}
+
+        return cached_response(TEST_TABLES, build)
 
     @admin_required()
     def post(self):
@@ -185,87 +426,108 @@ class TestListResource(Resource):
         return {'message': 'New test added.'}, HTTPStatus.CREATED
 
 
-import simpy
+def get_job_params(defaults):
+    """Return the integer parameters of a job request, missing ones take the default value."""
+    data = request.get_json(silent=True) or {}
+    params = {}
+    for key, default in defaults.items():
+        value = data.get(key, default)
+        if value is not None:
+            value = int(value)
+            if key != 'seed' and value < 1:
+                raise ValueError(f'{key} must be at least 1')
+            if key in MAX_JOB_PARAMS and value > MAX_JOB_PARAMS[key]:
+                raise ValueError(f'{key} must be at most {MAX_JOB_PARAMS[key]}')
+        params[key] = value
+    return params
 
-env = simpy.rt.RealtimeEnvironment(factor=0.1, strict=False)
-reception = simpy.Resource(env, capacity=1)
-instrument = simpy.Resource(env, capacity=1)
 
+def job_accepted(job):
+    return {'job_id': job.id, 'status': job.status, 'status_url': f'/jobs/{job.id}'}, HTTPStatus.ACCEPTED
 
-def check_item(env, order, waiting_time, check_duration):
-    yield env.timeout(waiting_time)
 
-    with reception.request() as req:
-        yield req
+def run_simulation_job(job, bind, receiver_id, num_orders, num_staff, seed):
+    result = generate_orders(num_orders, auto_receive=True, receiver_id=receiver_id, num_staff=num_staff,
+                             bind=bind, rng=random.Random(seed), progress=job.progress)
+    logger.info(f'SIMULATION JOB {job.id} ORDERED {len(result["order_ids"])} LAB ORDERS, '
+                f'{result["received"]} RECEIVED, {result["rejected"]} REJECTED')
+    return {'order_ids': result['order_ids'], 'received': result['received'], 'rejected': result['rejected']}
 
-        logging.info('Checking in...')
-        yield env.timeout(check_duration)
-        order.received_at = order.order_datetime + datetime.timedelta(minutes=env.now)
-        logger.info(f'LAB ORDER ID={order.id} RECEIVED AT {order.received_at}')
-        db.session.add(order)
-    db.session.commit()
-
-
-def run_test(env, item, duration):
-    start_datetime = datetime.datetime.now()
-    with instrument.request() as req:
-        yield req
-        logger.info(f'LAB ORDER ITEM ID={item.id} STARTED ANALYZING AT {start_datetime + datetime.timedelta(minutes=env.now)}')
-        yield env.timeout(duration)
-        item.finished_at = start_datetime + datetime.timedelta(minutes=env.now)
-        logger.info(f'LAB ORDER ITEM ID={item.id} FINISHED AT {item.finished_at}')
-        db.session.add(item)
-        db.session.commit()
+
+def run_analysis_job(job, bind, num_analyzers, seed):
+    result = analyze_pending_items(num_analyzers, rng=random.Random(seed), bind=bind, progress=job.progress)
+    logger.info(f'ANALYSIS JOB {job.id} FINISHED {len(result["item_ids"])} LAB ORDER ITEMS')
+    return {'item_ids': result['item_ids'], 'start_time': result['start_time'].isoformat(),
+            'utilization': result['utilization']}
 
 
 class SimulationResource(Resource):
     @jwt_required()
-    def get(self):
-        customer = Customer.query.order_by(func.random()).first()
-        tests = [t for t in Test.query.all()]
-        order = LabOrder(customer=customer, order_datetime=datetime.datetime.now())
-        n = 5 if len(tests) > 5 else len(tests)
-        for test in random.choices(tests, k=n):
-            order_item = LabOrderItem(test=test)
-            order.order_items.append(order_item)
-        env.process(check_item(env, order, 2, 1))
-        env.run()
-        db.session.commit()
-        return {'message': 'done'}
+    def post(self):
+        try:
+            params = get_job_params({'num_orders': 1, 'num_staff': 1, 'seed': None})
+        except (TypeError, ValueError) as e:
+            return {'message': f'Invalid parameters: {e}'}, HTTPStatus.BAD_REQUEST
+        try:
+            job = submit_job('simulation', params, run_simulation_job, db.engine, current_user.id, **params)
+        except JobQueueFull as e:
+            return {'message': str(e)}, HTTPStatus.SERVICE_UNAVAILABLE
+        return job_accepted(job)
 
 
 class AnalyzerResource(Resource):
     @jwt_required()
-    def get(self):
-        items = LabOrderItem.query.filter(LabOrderItem.finished_at==None)\
-            .filter(LabOrderItem.cancelled_at==None).all()
-        if not items:
-            return {'message': 'Nothing to analyze.'}, HTTPStatus.OK
-        for item in items:
-            env.process(run_test(env, item, random.randint(10, 40)))
-        env.run()
-        return {'message': 'Analyses finished.'}, HTTPStatus.OK
+    def post(self):
+        try:
+            params = get_job_params({'num_analyzers': 1, 'seed': None})
+        except (TypeError, ValueError) as e:
+            return {'message': f'Invalid parameters: {e}'}, HTTPStatus.BAD_REQUEST
+        try:
+            job = submit_job('analysis', params, run_analysis_job, db.engine, **params)
+        except JobQueueFull as e:
+            return {'message': str(e)}, HTTPStatus.SERVICE_UNAVAILABLE
+        return job_accepted(job)
+
+
+class JobResource(Resource):
+    @jwt_required()
+    def get(self, job_id):
+        job = get_job(job_id)
+        if not job:
+            return {'message': 'Job not found.'}, HTTPStatus.NOT_FOUND
+        return job.to_dict(), HTTPStatus.OK
 
 
 class OrderListResource(Resource):
     @jwt_required()
     def get(self):
-        orders = []
-        for order in LabOrder.query.order_by(LabOrder.order_datetime.desc()):
-            orders.append({
-                'id': order.id,
-                'order_datetime': order.order_datetime.isoformat(),
-                'received_datetime': order.received_at.isoformat(),
-                'rejected_datetime': order.rejected_at.isoformat() if order.rejected_at else None,
-                'rejected_by': order.rejector.lastname if order.rejector else None,
-                'cancelled_datetime': order.cancelled_at.isoformat() if order.cancelled_at else None,
-                'cancelled_by': order.canceller.lastname if order.canceller else None,
-                'firstname': order.customer.firstname,
-                'lastname': order.customer.lastname,
-                'hn': order.customer.hn,
-                'items': order.order_items.count()
-            })
-        return {'data': orders}
+        """Return a page of orders, newest first.
+
+        Filters: status=RECEIVED,APPROVED and start and end (ISO dates, start <= order_datetime < end).
+        """
+        try:
+            page_size, cursor = get_page_args()
+            cursor = decode_order_cursor(cursor) if cursor else None
+            query = order_api_rows_query(**get_order_filters(), cursor=cursor).limit(page_size + 1)
+        except ValueError as e:
+            return {'message': f'Invalid parameters: {e}'}, HTTPStatus.BAD_REQUEST
+        orders = [to_json_row(row) for row in db.session.execute(query)]
+        next_cursor = None
+        if len(orders) > page_size:
+            orders = orders[:page_size]
+            next_cursor = encode_cursor(orders[-1]['order_datetime'], orders[-1]['id'])
+        return {'data': orders, 'next_cursor': next_cursor}
+
+
+class OrderExportResource(Resource):
+    @jwt_required()
+    def get(self):
+        """Stream all orders that match the filters of the order list, format=ndjson or csv."""
+        try:
+            query = order_api_rows_query(**get_order_filters())
+        except ValueError as e:
+            return {'message': f'Invalid parameters: {e}'}, HTTPStatus.BAD_REQUEST
+        return export_response(query, 'orders')
 
 
 class OrderResource(Resource):
@@ -330,13 +592,96 @@ class OrderResource(Resource):
 class OrderItemListResource(Resource):
     @jwt_required()
     def get(self):
-        unfinished = request.args.get('unfinished')
-        if unfinished == 'true':
-            items = LabOrderItem.query.filter(LabOrderItem.finished_at==None)\
-                .filter(LabOrderItem.cancelled_at==None).all()
-        else:
-            items = LabOrderItem.query.all()
-        return {'data': [t.to_dict() for t in items]}
+        """Return a page of order items with the fields of LabOrderItem.to_dict.
+
+        Filters: status=pending,finished,reported,approved,cancelled, start and end
+        (ISO dates, start <= date_field < end, date_field is received_at by default),
+        code=GLU,HBA1C and hn=HN1,HN2. fields=code,value,finished_at returns only these
+        fields and the id.
+        """
+        try:
+            page_size, cursor = get_page_args()
+            last_id = decode_id_cursor(cursor) if cursor else 0
+            query = order_item_rows_query(get_list_arg('fields'), **get_order_item_filters())
+        except ValueError as e:
+            return {'message': f'Invalid parameters: {e}'}, HTTPStatus.BAD_REQUEST
+        data, next_cursor = load_page(query, page_size, last_id)
+        return {'data': data, 'next_cursor': next_cursor}
+
+    @jwt_required()
+    def patch(self):
+        """Report or approve many items in one transaction.
+
+        The body is a list of {"id", "value", "comment", "reported_at", "approved_at"}
+        objects, all keys but the id are optional. Items that are not found, not
+        allowed or not valid are skipped and the rest are saved together. The
+        response has the outcome of every item in the order of the request.
+        """
+        entries = request.get_json(silent=True)
+        if not isinstance(entries, list) or not entries:
+            return {'message': 'Send a list of order item changes.'}, HTTPStatus.BAD_REQUEST
+        if len(entries) > MAX_BULK_ITEMS:
+            return {'message': f'Send at most {MAX_BULK_ITEMS} items per request.'}, HTTPStatus.BAD_REQUEST
+        roles = {role.role_need for role in current_user.roles}
+        ids = [entry.get('id') for entry in entries if isinstance(entry, dict) and isinstance(entry.get('id'), int)]
+        items = {item.id: item for item in LabOrderItem.query.options(joinedload(LabOrderItem.test))
+                 .filter(LabOrderItem.id.in_(ids))}
+
+        now = datetime.datetime.now()
+        outcomes = []
+        seen = set()
+        reported = []
+        approved = []
+        for entry in entries:
+            item_id = entry.get('id') if isinstance(entry, dict) else None
+            if not isinstance(item_id, int):
+                outcomes.append({'id': item_id, 'status': 'invalid', 'message': 'The id must be an integer.'})
+                continue
+            if item_id in seen:
+                outcomes.append({'id': item_id, 'status': 'invalid', 'message': 'The item is listed more than once.'})
+                continue
+            seen.add(item_id)
+            item = items.get(item_id)
+            if item is None:
+                outcomes.append({'id': item_id, 'status': 'not_found', 'message': 'Lab order item not found.'})
+                continue
+            try:
+                changes = parse_item_changes(entry, roles, item.test)
+            except PermissionError as e:
+                outcomes.append({'id': item_id, 'status': 'forbidden', 'message': str(e)})
+                continue
+            except ValueError as e:
+                outcomes.append({'id': item_id, 'status': 'invalid', 'message': str(e)})
+                continue
+            for key, value in changes.items():
+                setattr(item, key, value)
+            if 'reported_at' in changes:
+                item.reporter = current_user
+                reported.append(item_id)
+            if 'approved_at' in changes:
+                item.approver = current_user
+                approved.append(item_id)
+            item.updater = current_user
+            item.updated_at = now
+            outcomes.append({'id': item_id, 'status': 'updated'})
+        db.session.commit()
+        if reported:
+            logger.info(f'{current_user.username} REPORTED {len(reported)} LAB ORDER ITEMS IDS={reported}')
+        if approved:
+            logger.info(f'{current_user.username} APPROVED {len(approved)} LAB ORDER ITEMS IDS={approved}')
+        updated = sum(1 for outcome in outcomes if outcome['status'] == 'updated')
+        return {'data': outcomes, 'updated': updated, 'skipped': len(outcomes) - updated}, HTTPStatus.OK
+
+
+class OrderItemExportResource(Resource):
+    @jwt_required()
+    def get(self):
+        """Stream all order items that match the filters and fields of the order item list, format=ndjson or csv."""
+        try:
+            query = order_item_rows_query(get_list_arg('fields'), **get_order_item_filters())
+        except ValueError as e:
+            return {'message': f'Invalid parameters: {e}'}, HTTPStatus.BAD_REQUEST
+        return export_response(query, 'order-items')
 
 
 class OrderItemResource(Resource):
@@ -0,0 +1,169 @@
+"""Bulk import of the test catalog.
+
+The rows are validated and written in a single transaction with executemany
+inserts and updates instead of going through Test.__init__, which opens its own
+session and commits once per test.
+
+    python -m app.system.catalog tests.csv [--dry-run]
+"""
+import argparse
+import csv
+import json
+import os
+
+from sqlalchemy import select, insert, update
+from sqlalchemy.orm import Session
+
+from app.system.models import engine, Test, TestMethod, Specimens
+
+TEST_ATTRIBUTES = [
+    "code", "tmlt_code", "tmlt_name", "loinc_no", "component", "label", "scale", "specimens", "method",
+    "price", "desc", "unit", "order_type", "cgd_code", "cgd_name", "cgd_price", "panel", "ref_min", "ref_max",
+    "value_choices", "active"
+]
+NUMERIC_ATTRIBUTES = ['price', 'cgd_price', 'ref_min', 'ref_max']
+REQUIRED_ATTRIBUTES = ['code', 'tmlt_name', 'loinc_no', 'label', 'scale', 'specimens', 'method', 'unit', 'order_type']
+
+
+def read_catalog(filepath):
+    """Read catalog rows from a CSV, XLSX or JSONL file as a list of dictionaries."""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.csv':
+        with open(filepath, newline='', encoding='utf-8-sig') as f:
+            return list(csv.DictReader(f))
+    elif ext in ('.xlsx', '.xls'):
+        import pandas as pd
+        df = pd.read_excel(filepath, dtype=str).fillna('')
+        return df.to_dict(orient='records')
+    elif ext in ('.jsonl', '.ndjson'):
+        with open(filepath, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    raise ValueError(f'Unsupported catalog file type: {ext}')
+
+
+def parse_active(value):
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', '0', 'false', 'no', 'n')
+    return True if value is None else bool(value)
+
+
+def clean_row(row):
+    """Convert a raw catalog row to column values in the same way as Test.__init__."""
+    data = {attr: row.get(attr) for attr in TEST_ATTRIBUTES}
+    for attr in data:
+        if isinstance(data[attr], str):
+            data[attr] = data[attr].strip()
+    missing = [attr for attr in REQUIRED_ATTRIBUTES if data[attr] is None or (attr == 'code' and not data[attr])]
+    if missing:
+        raise ValueError(f'Missing {", ".join(missing)}')
+    for attr in NUMERIC_ATTRIBUTES:
+        try:
+            data[attr] = float(data[attr]) if data[attr] else None
+        except ValueError:
+            raise ValueError(f'{attr} is not a number: {data[attr]!r}')
+    if data['price'] is None:
+        data['price'] = 0.0
+    data['tmlt_code'] = data['tmlt_code'] or None
+    data['active'] = parse_active(data['active'])
+    return data
+
+
+def import_tests(rows, bind=engine, dry_run=False):
+    """Insert or update tests by code, or by TMLT code for tests that have no matching code.
+
+    Rows with invalid data or conflicting codes are reported and skipped, the rest of
+    the batch is written in one transaction. Returns a dictionary with the number of
+    inserted and updated tests and a list of (row number, message) errors.
+    """
+    report = {'inserted': 0, 'updated': 0, 'errors': []}
+    with Session(bind) as session:
+        methods = {m.method: m.id for m in session.scalars(select(TestMethod))}
+        specimens = {s.label: s.id for s in session.scalars(select(Specimens))}
+        code_ids = {}
+        tmlt_ids = {}
+        loinc_ids = {}
+        for test_id, code, tmlt_code, loinc_no in session.execute(select(Test.id, Test.code,
+                                                                         Test.tmlt_code, Test.loinc_no)):
+            code_ids[code] = test_id
+            if tmlt_code:
+                tmlt_ids[tmlt_code] = test_id
+            loinc_ids[loinc_no] = test_id
+
+        seen_codes = set()
+        seen_ids = set()
+        new_tests = []
+        updated_tests = []
+        for row_no, row in enumerate(rows, start=1):
+            try:
+                data = clean_row(row)
+            except ValueError as e:
+                report['errors'].append((row_no, str(e)))
+                continue
+            if data['code'] in seen_codes:
+                report['errors'].append((row_no, f'Duplicate code {data["code"]} in the file'))
+                continue
+            test_id = code_ids.get(data['code']) or tmlt_ids.get(data['tmlt_code'])
+            # test_id is the reserved key of an earlier new row when that row has the same TMLT code.
+            if test_id in seen_ids:
+                report['errors'].append((row_no, f'TMLT code {data["tmlt_code"]} is used by another row'))
+                continue
+            if data['tmlt_code'] and tmlt_ids.get(data['tmlt_code'], test_id) != test_id:
+                report['errors'].append((row_no, f'TMLT code {data["tmlt_code"]} belongs to another test'))
+                continue
+            if loinc_ids.get(data['loinc_no'], test_id) != test_id:
+                report['errors'].append((row_no, f'LOINC number {data["loinc_no"]} belongs to another test'))
+                continue
+            # Reserve the codes so that later rows in the same file cannot reuse them.
+            key = test_id or ('new', row_no)
+            seen_codes.add(data['code'])
+            seen_ids.add(key)
+            code_ids[data['code']] = key
+            loinc_ids[data['loinc_no']] = key
+            if data['tmlt_code']:
+                tmlt_ids[data['tmlt_code']] = key
+            if test_id:
+                data['id'] = test_id
+                updated_tests.append(data)
+            else:
+                new_tests.append(data)
+
+        new_methods = {t['method'] for t in new_tests + updated_tests} - methods.keys()
+        new_specimens = {t['specimens'] for t in new_tests + updated_tests} - specimens.keys()
+        method_objs = [TestMethod(method=m) for m in new_methods]
+        specimens_objs = [Specimens(label=s) for s in new_specimens]
+        session.add_all(method_objs + specimens_objs)
+        session.flush()
+        methods.update({m.method: m.id for m in method_objs})
+        specimens.update({s.label: s.id for s in specimens_objs})
+
+        for data in new_tests + updated_tests:
+            data['method_id'] = methods[data.pop('method')]
+            data['specimens_id'] = specimens[data.pop('specimens')]
+        if new_tests:
+            session.execute(insert(Test), new_tests)
+        if updated_tests:
+            session.execute(update(Test), updated_tests)
+        report['inserted'] = len(new_tests)
+        report['updated'] = len(updated_tests)
+        if dry_run:
+            session.rollback()
+        else:
+            session.commit()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a test catalog from a CSV, XLSX or JSONL file.')
+    parser.add_argument('filepath')
+    parser.add_argument('--dry-run', action='store_true', help='validate the file without saving the tests')
+    args = parser.parse_args()
+
+    report = import_tests(read_catalog(args.filepath), dry_run=args.dry_run)
+    for row_no, message in report['errors']:
+        print(f'Row {row_no}: {message}')
+    print(f'{report["inserted"]} tests inserted, {report["updated"]} tests updated, '
+          f'{len(report["errors"])} rows skipped.')
+
+
+if __name__ == '__main__':
+    main()
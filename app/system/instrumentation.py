@@ -0,0 +1,89 @@
+"""Count the SQL statements, their latency and the rows they touch per logical operation.
+
+An operation is a window function decorated with login_required, or any block
+wrapped in track_operation. Statements run outside of an operation are counted
+under the name 'other'. Rows are the ORM objects loaded plus the rows changed
+by INSERT, UPDATE and DELETE statements, so an N+1 lazy load shows up as a
+large number of statements and rows for one operation.
+"""
+import contextlib
+import contextvars
+import json
+import threading
+import time
+
+from sqlalchemy import event
+
+from app.system.models import engine, Base
+
+current_operation = contextvars.ContextVar('current_operation', default='other')
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def _get_stats(name):
+    if name not in _stats:
+        _stats[name] = {'calls': 0, 'statements': 0, 'total_time': 0.0, 'max_time': 0.0,
+                        'rows': 0, 'wall_time': 0.0}
+    return _stats[name]
+
+
+@contextlib.contextmanager
+def track_operation(name):
+    token = current_operation.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current_operation.reset(token)
+        with _lock:
+            stats = _get_stats(name)
+            stats['calls'] += 1
+            stats['wall_time'] += time.perf_counter() - started
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    with _lock:
+        stats = _get_stats(current_operation.get())
+        stats['statements'] += 1
+        stats['total_time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        if cursor.rowcount > 0:
+            stats['rows'] += cursor.rowcount
+
+
+def count_loaded_object(target, context):
+    with _lock:
+        _get_stats(current_operation.get())['rows'] += 1
+
+
+def instrument_engine(bind):
+    event.listen(bind, 'before_cursor_execute', before_cursor_execute)
+    event.listen(bind, 'after_cursor_execute', after_cursor_execute)
+
+
+instrument_engine(engine)
+event.listen(Base, 'load', count_loaded_object, propagate=True)
+
+
+def get_stats():
+    """Return a copy of the statistics of every operation, slowest total SQL time first."""
+    with _lock:
+        stats = {name: dict(values) for name, values in _stats.items()}
+    return dict(sorted(stats.items(), key=lambda item: item[1]['total_time'], reverse=True))
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def dump_stats(filepath):
+    with open(filepath, 'w') as f:
+        json.dump(get_stats(), f, indent=2)
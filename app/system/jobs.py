@@ -0,0 +1,91 @@
+"""Background jobs for the API.
+
+submit_job queues a function on a bounded thread pool and returns a Job right
+away, so a request does not wait for a simulation to finish. The function
+receives the Job as its first argument and may report its progress with
+job.progress(done, total, message). Finished jobs are kept in memory for the
+status endpoint, the oldest ones are dropped after MAX_KEPT_JOBS.
+"""
+import collections
+import datetime
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 2
+MAX_QUEUED_JOBS = 50
+MAX_KEPT_JOBS = 1000
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='job')
+_lock = threading.Lock()
+_jobs = collections.OrderedDict()
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.submitted_at = datetime.datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.progress_info = None
+        self.result = None
+        self.error = None
+
+    def progress(self, done, total=None, message=''):
+        self.progress_info = {'done': done, 'total': total, 'message': message}
+
+    def _run(self, func, args, kwargs):
+        self.status = 'running'
+        self.started_at = datetime.datetime.now()
+        try:
+            self.result = func(self, *args, **kwargs)
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'failed'
+        else:
+            self.status = 'finished'
+        self.finished_at = datetime.datetime.now()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'submitted_at': self.submitted_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'progress': self.progress_info,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+def submit_job(kind, params, func, *args, **kwargs):
+    """Queue func(job, *args, **kwargs) and return the Job.
+
+    Raises JobQueueFull when MAX_QUEUED_JOBS jobs are already waiting or running.
+    """
+    with _lock:
+        active = sum(1 for job in _jobs.values() if job.status in ('queued', 'running'))
+        if active >= MAX_QUEUED_JOBS:
+            raise JobQueueFull(f'There are already {active} jobs waiting or running.')
+        job = Job(kind, params)
+        _jobs[job.id] = job
+        done = [job_id for job_id, job in _jobs.items() if job.status in ('finished', 'failed')]
+        for job_id in done[:max(0, len(_jobs) - MAX_KEPT_JOBS)]:
+            del _jobs[job_id]
+    _executor.submit(job._run, func, args, kwargs)
+    return job
+
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
@@ -6,7 +6,8 @@ from system.apis.views import (UserResource,
                                AdminBioSource,
                                TestListResource, SimulationResource, OrderListResource, OrderResource,
                                OrderItemResource, OrderItemListResource, AnalyzerResource, OrderItemVersionListResource,
-                               CustomerListResource, CustomerResource)
+                               CustomerListResource, CustomerResource, JobResource, OrderExportResource,
+                               OrderItemExportResource)
 from system.extensions import db, flask_api, jwt
 
 
@@ -39,6 +40,9 @@ flask_api.add_resource(OrderItemResource, '/order-items/<int:lab_order_item_id>'
 flask_api.add_resource(OrderItemListResource, '/order-items')
 flask_api.add_resource(OrderItemVersionListResource, '/order-items/<int:lab_order_item_id>/versions')
 flask_api.add_resource(AnalyzerResource, '/analyses')
+flask_api.add_resource(JobResource, '/jobs/<string:job_id>')
+flask_api.add_resource(OrderExportResource, '/exports/orders')
+flask_api.add_resource(OrderItemExportResource, '/exports/order-items')
 
 app.register_blueprint(api_bp)
 
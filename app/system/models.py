@@ -5,23 +5,60 @@ from faker import Faker
 from typing import List
 
 from sqlalchemy_continuum import make_versioned
-from sqlalchemy import create_engine, select
+from sqlalchemy import create_engine, event, inspect, select, text, func, case, delete, and_
 from sqlalchemy import (
     ForeignKey, String, Integer,
     Table, Column, Boolean,
     Text, Numeric, Date,
-    DateTime
+    DateTime, Index, Float
 )
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import DeclarativeBase, configure_mappers, Session
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.pool import QueuePool
 
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 
-from app.config import DATABASE_URI
+from app.config import DATABASE_URI, config_dict
 
 make_versioned()
 
-engine = create_engine(DATABASE_URI)
+
+def create_db_engine(database_uri=DATABASE_URI, **options):
+    """Create an SQLite engine tuned with the settings in the database section of config.yaml.
+
+    Every new DBAPI connection is switched to WAL mode with a busy timeout so that
+    readers do not block writers and concurrent writers wait instead of failing
+    with "database is locked". Keyword arguments override the config values.
+    """
+    settings = {**config_dict['database'], **options}
+    busy_timeout = int(settings['busy_timeout'])
+    _engine = create_engine(database_uri,
+                            poolclass=QueuePool,
+                            pool_size=int(settings['pool_size']),
+                            max_overflow=int(settings['max_overflow']),
+                            pool_recycle=int(settings['pool_recycle']),
+                            pool_pre_ping=True,
+                            connect_args={'timeout': busy_timeout / 1000,
+                                          'check_same_thread': False})
+
+    @event.listens_for(_engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={settings['synchronous']}")
+        # A negative cache_size is interpreted by SQLite as KiB instead of pages.
+        cursor.execute(f"PRAGMA cache_size=-{abs(int(settings['cache_size']))}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings['mmap_size'])}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
+
+    return _engine
+
+
+engine = create_db_engine()
 
 
 class Base(DeclarativeBase):
@@ -263,6 +300,11 @@ class Customer(Base):
 
 class LabOrder(Base):
     __tablename__ = 'lab_orders'
+    __table_args__ = (
+        Index('ix_lab_orders_customer_id', 'customer_id'),
+        # Order lists are sorted by the order time, the id breaks ties between orders made at the same time.
+        Index('ix_lab_orders_order_datetime_id', 'order_datetime', 'id'),
+    )
     id: Mapped[int] = mapped_column(Integer(), autoincrement=True, primary_key=True)
     customer_id: Mapped[int] = mapped_column('customer_id', ForeignKey('customers.id'))
     order_datetime: Mapped[datetime] = mapped_column('order_datetime', DateTime(), nullable=True)
@@ -284,11 +326,20 @@ class LabOrder(Base):
     order_items: Mapped[List["LabOrderItem"]] = relationship(back_populates="order", cascade="all, delete-orphan")
     doctor_id: Mapped[int] = mapped_column('doctor_id', ForeignKey('doctors.id'), nullable=True)
     doctor: Mapped["Doctor"] = relationship(foreign_keys=[doctor_id])
+    # STAT orders are analyzed before routine orders.
+    is_stat: Mapped[bool] = mapped_column('is_stat', Boolean(), default=False, server_default=text('0'))
 
 
 class LabOrderItem(Base):
     __versioned__ = {}
     __tablename__ = 'lab_order_items'
+    __table_args__ = (
+        Index('ix_lab_order_items_order_id', 'order_id'),
+        Index('ix_lab_order_items_finished_at_cancelled_at', 'finished_at', 'cancelled_at'),
+        # The worklist only needs the items waiting to be analyzed, which are a small part of the table.
+        Index('ix_lab_order_items_pending', 'order_id',
+              sqlite_where=text('finished_at IS NULL AND cancelled_at IS NULL')),
+    )
     id: Mapped[int] = mapped_column(Integer(), autoincrement=True, primary_key=True)
     order_id: Mapped[int] = mapped_column('order_id', ForeignKey('lab_orders.id'))
     test_id: Mapped[int] = mapped_column('test_id', ForeignKey('tests.id'))
@@ -312,13 +363,13 @@ class LabOrderItem(Base):
     reject_records: Mapped[List["LabRejectRecord"]] = relationship(back_populates="order_item",
                                                                    cascade="all, delete-orphan")
 
-    def random_value(self):
+    def random_value(self, rng=random):
         if self.test.scale == 'Quantitative':
-            _value = random.randint(1, 300)
+            _value = rng.randint(1, 300)
             self._value = str(_value)
         else:
             if self.test.value_choices:
-                self._value = random.choice(self.test.value_choices.split(','))
+                self._value = rng.choice(self.test.value_choices.split(','))
 
     @property
     def value(self):
@@ -362,9 +413,201 @@ class LabRejectRecord(Base):
     order_item: Mapped["LabOrderItem"] = relationship(back_populates='reject_records')
 
 
+class LabOrderSummary(Base):
+    """Denormalized status, item counts and turnaround times of an order.
+
+    The rows are kept up to date by refresh_order_summary after every flush that touches
+    an order or its items, so order lists can be read without loading the items.
+    Turnaround times are in minutes.
+    """
+    __tablename__ = 'lab_order_summary'
+    __table_args__ = (
+        Index('ix_lab_order_summary_order_datetime_order_id', 'order_datetime', 'order_id'),
+        Index('ix_lab_order_summary_status', 'status'),
+        Index('ix_lab_order_summary_customer_id', 'customer_id'),
+    )
+    order_id: Mapped[int] = mapped_column('order_id', ForeignKey('lab_orders.id'), primary_key=True)
+    customer_id: Mapped[int] = mapped_column('customer_id', Integer(), nullable=True)
+    doctor_id: Mapped[int] = mapped_column('doctor_id', Integer(), nullable=True)
+    order_datetime: Mapped[datetime] = mapped_column('order_datetime', DateTime(), nullable=True)
+    status: Mapped[str] = mapped_column('status', String(), nullable=False)
+    status_datetime: Mapped[datetime] = mapped_column('status_datetime', DateTime(), nullable=True)
+    total_items: Mapped[int] = mapped_column('total_items', Integer(), default=0)
+    finished_items: Mapped[int] = mapped_column('finished_items', Integer(), default=0)
+    reported_items: Mapped[int] = mapped_column('reported_items', Integer(), default=0)
+    approved_items: Mapped[int] = mapped_column('approved_items', Integer(), default=0)
+    receive_tat: Mapped[float] = mapped_column('receive_tat', Float(), nullable=True)
+    analysis_tat: Mapped[float] = mapped_column('analysis_tat', Float(), nullable=True)
+    total_tat: Mapped[float] = mapped_column('total_tat', Float(), nullable=True)
+
+
+class TableVersion(Base):
+    """Version counter of a table for the conditional GET requests of the API.
+
+    The counter is bumped in every transaction that writes the table, see bump_table_versions.
+    modified_at is in UTC.
+    """
+    __tablename__ = 'table_versions'
+    table_name: Mapped[str] = mapped_column('table_name', String(), primary_key=True)
+    version: Mapped[int] = mapped_column('version', Integer(), nullable=False)
+    modified_at: Mapped[datetime] = mapped_column('modified_at', DateTime(), nullable=False)
+
+
 configure_mappers()
 
 
+def order_status_columns():
+    """Return the SQL expressions for the status of an order and the time the status was set.
+
+    The precedence matches the order in which the GUI used to check the order attributes.
+    """
+    status = case(
+        (LabOrder.approved_at != None, 'APPROVED'),
+        (LabOrder.rejected_at != None, 'REJECTED'),
+        (LabOrder.cancelled_at != None, 'CANCELLED'),
+        (LabOrder.received_at != None, 'RECEIVED'),
+        else_='PENDING',
+    )
+    status_datetime = func.coalesce(LabOrder.approved_at,
+                                    LabOrder.rejected_at,
+                                    LabOrder.cancelled_at,
+                                    LabOrder.received_at)
+    return status, status_datetime
+
+
+def minutes_between(start, end):
+    return (func.julianday(end) - func.julianday(start)) * 1440
+
+
+def refresh_order_summary(connection, condition=None):
+    """Recompute the summary rows of the orders matching condition, or of all orders."""
+    items = (select(LabOrderItem.order_id,
+                    func.count(LabOrderItem.id).label('total'),
+                    func.count(LabOrderItem.finished_at).label('finished'),
+                    func.count(LabOrderItem.reported_at).label('reported'),
+                    func.count(LabOrderItem.approved_at).label('approved'),
+                    func.sum(case((and_(LabOrderItem.finished_at == None, LabOrderItem.cancelled_at == None), 1),
+                                  else_=0)).label('pending'),
+                    func.max(LabOrderItem.finished_at).label('last_finished_at'))
+             .group_by(LabOrderItem.order_id))
+    if condition is not None:
+        items = items.where(LabOrderItem.order_id.in_(select(LabOrder.id).where(condition)))
+    items = items.subquery()
+    status, status_datetime = order_status_columns()
+    query = (select(LabOrder.id,
+                    LabOrder.customer_id,
+                    LabOrder.doctor_id,
+                    LabOrder.order_datetime,
+                    status,
+                    status_datetime,
+                    func.coalesce(items.c.total, 0),
+                    func.coalesce(items.c.finished, 0),
+                    func.coalesce(items.c.reported, 0),
+                    func.coalesce(items.c.approved, 0),
+                    minutes_between(LabOrder.order_datetime, LabOrder.received_at),
+                    case((and_(items.c.pending == 0, items.c.finished > 0),
+                          minutes_between(LabOrder.received_at, items.c.last_finished_at)),
+                         else_=None),
+                    minutes_between(LabOrder.order_datetime, LabOrder.approved_at))
+             .outerjoin(items, items.c.order_id == LabOrder.id))
+    if condition is not None:
+        query = query.where(condition)
+    columns = ['order_id', 'customer_id', 'doctor_id', 'order_datetime', 'status', 'status_datetime',
+               'total_items', 'finished_items', 'reported_items', 'approved_items',
+               'receive_tat', 'analysis_tat', 'total_tat']
+    connection.execute(sqlite_insert(LabOrderSummary).from_select(columns, query).prefix_with('OR REPLACE'))
+
+
+def rebuild_order_summary(bind=engine):
+    with bind.begin() as connection:
+        connection.execute(delete(LabOrderSummary))
+        refresh_order_summary(connection)
+        return connection.scalar(select(func.count()).select_from(LabOrderSummary))
+
+
+@event.listens_for(Session, 'after_flush')
+def update_order_summary(session, flush_context):
+    order_ids = set()
+    deleted_order_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, LabOrder):
+            if obj in session.deleted:
+                deleted_order_ids.add(obj.id)
+            else:
+                order_ids.add(obj.id)
+        elif isinstance(obj, LabOrderItem):
+            order_ids.add(obj.order_id)
+            # An item moved to another order changes the counts of both orders.
+            order_ids.update(inspect(obj).attrs.order_id.history.deleted)
+    order_ids = sorted(order_ids - deleted_order_ids - {None})
+    connection = session.connection()
+    if deleted_order_ids:
+        connection.execute(delete(LabOrderSummary).where(LabOrderSummary.order_id.in_(deleted_order_ids)))
+    # Keep the number of bound parameters well below the SQLite limit.
+    for i in range(0, len(order_ids), 500):
+        refresh_order_summary(connection, LabOrder.id.in_(order_ids[i:i + 500]))
+
+
+def bump_table_versions(connection, tables):
+    """Bump the versions of the tables in the transaction of connection, so they change when it commits."""
+    if not tables:
+        return
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    statement = sqlite_insert(TableVersion).values([{'table_name': table, 'version': 1, 'modified_at': now}
+                                                    for table in sorted(tables)])
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[TableVersion.table_name],
+        set_={'version': TableVersion.version + 1, 'modified_at': statement.excluded.modified_at}))
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_flushed_table_versions(session, flush_context):
+    # Objects whose many-to-many collections changed are dirty too, so the association tables are covered.
+    tables = set()
+    for obj in [*session.new, *session.dirty, *session.deleted]:
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            tables.add(table.name)
+    bump_table_versions(session.connection(), tables)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def bump_executed_table_versions(orm_execute_state):
+    # ORM-enabled INSERT, UPDATE and DELETE statements, e.g. the bulk writes of the catalog import.
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            bump_table_versions(orm_execute_state.session.connection(), {table.name})
+
+
+def migrate_db(bind=engine):
+    """Bring a database created by an older version of the app up to the current schema.
+
+    create_all only creates missing tables, so columns and indexes added to existing
+    tables are created here. New columns must be nullable or have a server default.
+    """
+    inspector = inspect(bind)
+    has_order_summary = inspector.has_table(LabOrderSummary.__tablename__)
+    Base.metadata.create_all(bind)
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    print(f'Adding column {column.name} to {table.name}...')
+                    column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}'))
+            existing_indexes = {idx['name'] for idx in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    print(f'Creating index {index.name} on {table.name}...')
+                    index.create(connection)
+    if not has_order_summary:
+        print('Building the order summary table...')
+        rebuild_order_summary(bind)
+
+
 def initialize_db():
     Base.metadata.create_all(engine)
     print('Populating a default admin account...')
@@ -420,11 +663,6 @@ def initialize_db():
         session.commit()
 
     print('Populating lab tests...')
-    test_attribues = [
-        "code", "tmlt_code", "tmlt_name", "loinc_no", "component", "label", "scale", "specimens", "method",
-        "price", "desc", "unit", "order_type", "cgd_code", "cgd_name", "cgd_price", "panel", "ref_min", "ref_max",
-        "value_choices", "active"
-    ]
     test_data = [
         [
             "TG", "320072", "Triglyceride [mg/dL] in Serum or Plasma", "2571-8", "Triglyceride", "Triglyceride",
@@ -478,12 +716,6 @@ def initialize_db():
             "150", "", "", "7.0", "", True,
          ]
     ]
-    test_objs = []
-    for test in test_data:
-        test_dict = dict(zip(test_attribues, test))
-        new_test = Test(**test_dict)
-        test_objs.append(new_test)
-    with Session(engine) as session:
-        session.add_all(test_objs)
-        session.commit()
+    from app.system.catalog import TEST_ATTRIBUTES, import_tests
+    import_tests([dict(zip(TEST_ATTRIBUTES, test)) for test in test_data])
 
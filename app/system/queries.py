@@ -0,0 +1,327 @@
+import base64
+import datetime
+
+from sqlalchemy import select, func, tuple_, case, cast, and_, or_, Float
+from sqlalchemy.orm import contains_eager, selectinload, aliased
+
+from app.system.models import LabOrder, LabOrderItem, LabOrderSummary, Customer, Doctor, Test, User
+
+DATETIME_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row of a page as an opaque string for API clients."""
+    parts = [v.isoformat() if isinstance(v, datetime.datetime) else str(v) for v in values]
+    return base64.urlsafe_b64encode('|'.join(parts).encode()).decode()
+
+
+def decode_order_cursor(cursor):
+    order_datetime, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.datetime.fromisoformat(order_datetime), int(order_id)
+
+
+def decode_id_cursor(cursor):
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+
+def order_rows_query():
+    """Return the query of the order list table read from the order summary, newest orders first."""
+    return (select(LabOrderSummary.order_id,
+                   Customer.hn,
+                   Customer.firstname + ' ' + Customer.lastname,
+                   func.coalesce(func.strftime(DATETIME_FORMAT, LabOrderSummary.order_datetime), ''),
+                   Doctor.fullname,
+                   LabOrderSummary.status,
+                   func.coalesce(func.strftime(DATETIME_FORMAT, LabOrderSummary.status_datetime), ''),
+                   LabOrderSummary.total_items)
+            .outerjoin(Customer, LabOrderSummary.customer_id == Customer.id)
+            .outerjoin(Doctor, LabOrderSummary.doctor_id == Doctor.id)
+            .order_by(LabOrderSummary.order_datetime.desc(), LabOrderSummary.order_id.desc()))
+
+
+def load_order_rows(session):
+    """Return all rows of the order list table without loading any ORM objects."""
+    return [list(row) for row in session.execute(order_rows_query())]
+
+
+def load_order_page(session, page_size, cursor=None):
+    """Return a page of order list rows that come after cursor and the cursor of the next page.
+
+    The cursor is the (order_datetime, order_id) of the last row of the previous page. The
+    page is found by seeking in the (order_datetime, order_id) index, so the cost does not
+    depend on how deep the page is. The next cursor is None on the last page.
+    """
+    query = order_rows_query().add_columns(LabOrderSummary.order_datetime).limit(page_size + 1)
+    if cursor:
+        query = query.where(tuple_(LabOrderSummary.order_datetime, LabOrderSummary.order_id) < cursor)
+    rows = session.execute(query).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = (rows[-1][-1], rows[-1][0])
+    return [list(row[:-1]) for row in rows], next_cursor
+
+
+def pending_items_query():
+    """Return the query of received items that have not been analyzed or cancelled.
+
+    The order is joined for the received_at filter and the test with its method and the
+    customer are loaded with one extra SELECT each, so the number of queries does not grow
+    with the worklist.
+    """
+    return (select(LabOrderItem)
+            .join(LabOrderItem.order)
+            .where(LabOrderItem.finished_at == None,
+                   LabOrderItem.cancelled_at == None,
+                   LabOrder.received_at != None)
+            .options(contains_eager(LabOrderItem.order).selectinload(LabOrder.customer),
+                     selectinload(LabOrderItem.test).selectinload(Test.method))
+            .order_by(LabOrder.received_at, LabOrderItem.id))
+
+
+def load_pending_items(session):
+    return session.scalars(pending_items_query()).all()
+
+
+def load_worklist_rows(session):
+    rows = []
+    for item in load_pending_items(session):
+        rows.append([
+            item.id,
+            item.test.code,
+            item.test.label,
+            item.test.tmlt_name,
+            item.order.received_at.strftime(DATETIME_FORMAT),
+            item.order.customer.hn,
+            item.order.customer.fullname,
+        ])
+    return rows
+
+
+def load_order_item_rows(session, order_id):
+    query = (select(LabOrderItem)
+             .where(LabOrderItem.order_id == order_id)
+             .options(selectinload(LabOrderItem.test),
+                      selectinload(LabOrderItem.reporter),
+                      selectinload(LabOrderItem.approver)))
+    rows = []
+    for item in session.scalars(query):
+        rows.append([
+            item.id,
+            item.test.code,
+            item.test.tmlt_name,
+            item.value_string or '',
+            item.reported_at.strftime(DATETIME_FORMAT) if item.reported_at else '',
+            item.reporter or '',
+            item.approved_at.strftime(DATETIME_FORMAT) if item.approved_at else '',
+            item.approver or '',
+            item.finished_at.strftime(DATETIME_FORMAT) if item.finished_at else '',
+            item.cancelled_at.strftime(DATETIME_FORMAT) if item.cancelled_at else '',
+        ])
+    return rows
+
+
+ORDER_STATUSES = ('PENDING', 'RECEIVED', 'CANCELLED', 'REJECTED', 'APPROVED')
+
+
+def order_api_rows_query(statuses=None, start=None, end=None, cursor=None):
+    """Return the query of the order API rows, newest orders first.
+
+    The rows are read from the order summary. The filters are the statuses of
+    ORDER_STATUSES and start <= order_datetime < end, and only the orders after
+    the (order_datetime, order_id) cursor are returned when it is given. Raises
+    ValueError for unknown statuses.
+    """
+    if statuses and not set(statuses) <= set(ORDER_STATUSES):
+        raise ValueError(f'status must be one of {", ".join(ORDER_STATUSES)}')
+    rejector = aliased(User, name='rejector')
+    canceller = aliased(User, name='canceller')
+    query = (select(LabOrderSummary.order_id.label('id'),
+                    LabOrderSummary.order_datetime.label('order_datetime'),
+                    LabOrder.received_at.label('received_datetime'),
+                    LabOrder.rejected_at.label('rejected_datetime'),
+                    rejector.lastname.label('rejected_by'),
+                    LabOrder.cancelled_at.label('cancelled_datetime'),
+                    canceller.lastname.label('cancelled_by'),
+                    Customer.firstname.label('firstname'),
+                    Customer.lastname.label('lastname'),
+                    Customer.hn.label('hn'),
+                    LabOrderSummary.status.label('status'),
+                    LabOrderSummary.status_datetime.label('status_datetime'),
+                    LabOrderSummary.total_items.label('items'),
+                    LabOrderSummary.finished_items.label('finished_items'),
+                    LabOrderSummary.reported_items.label('reported_items'),
+                    LabOrderSummary.approved_items.label('approved_items'),
+                    LabOrderSummary.receive_tat.label('receive_tat'),
+                    LabOrderSummary.analysis_tat.label('analysis_tat'),
+                    LabOrderSummary.total_tat.label('total_tat'))
+             .join(LabOrder, LabOrder.id == LabOrderSummary.order_id)
+             .outerjoin(Customer, Customer.id == LabOrderSummary.customer_id)
+             .outerjoin(rejector, rejector.id == LabOrder.rejector_id)
+             .outerjoin(canceller, canceller.id == LabOrder.canceller_id)
+             .order_by(LabOrderSummary.order_datetime.desc(), LabOrderSummary.order_id.desc()))
+    if statuses:
+        query = query.where(LabOrderSummary.status.in_(statuses))
+    if start:
+        query = query.where(LabOrderSummary.order_datetime >= start)
+    if end:
+        query = query.where(LabOrderSummary.order_datetime < end)
+    if cursor:
+        query = query.where(tuple_(LabOrderSummary.order_datetime, LabOrderSummary.order_id) < cursor)
+    return query
+
+
+ORDER_ITEM_STATUSES = ('pending', 'finished', 'reported', 'approved', 'cancelled')
+ORDER_ITEM_DATE_FIELDS = ('received_at', 'finished_at', 'reported_at', 'approved_at', 'cancelled_at', 'updated_at')
+
+
+def _number_or_text(value):
+    """Return the SQL expression of value as a float when the text is a number and as the text otherwise.
+
+    CAST alone turns any text into a number, e.g. '<5' into 0.0 and '12 H' into 12.0, so
+    only the texts that are JSON numbers are cast. json_type is only called on valid JSON.
+    """
+    return case((func.json_valid(value) == 1,
+                 case((func.json_type(value).in_(('integer', 'real')), cast(value, Float)), else_=value)),
+                else_=value)
+
+
+def _order_item_fields(approver, reporter):
+    """Return the SQL expression and the joined tables of each field of LabOrderItem.to_dict."""
+    value = LabOrderItem._value
+    return {
+        'id': (LabOrderItem.id, ()),
+        'order_id': (LabOrderItem.order_id, ()),
+        'code': (Test.code, ('test',)),
+        'tmlt_name': (Test.tmlt_name, ('test',)),
+        'value': (case((Test.scale == 'Quantitative', _number_or_text(value)), else_=value), ('test',)),
+        'comment': (LabOrderItem.comment, ()),
+        'label': (Test.label, ('test',)),
+        'hn': (Customer.hn, ('order', 'customer')),
+        'patient': (Customer.firstname + ' ' + Customer.lastname, ('order', 'customer')),
+        'received_at': (LabOrder.received_at, ('order',)),
+        'value_string': (case((func.coalesce(value, '') == '', 'N/A'),
+                              else_=func.trim(value + ' ' + func.coalesce(Test.unit, ''))), ('test',)),
+        'reported_at': (LabOrderItem.reported_at, ()),
+        'approved_at': (LabOrderItem.approved_at, ()),
+        'finished_at': (LabOrderItem.finished_at, ()),
+        'cancelled_at': (LabOrderItem.cancelled_at, ()),
+        'approver_name': (approver.lastname, ('approver',)),
+        'reporter_name': (reporter.lastname, ('reporter',)),
+    }
+
+
+def order_item_status_filter(status):
+    """Return the condition of the items in the status, the latest step an item has reached."""
+    if status == 'cancelled':
+        return LabOrderItem.cancelled_at != None
+    conditions = [LabOrderItem.cancelled_at == None]
+    for step in ('approved', 'reported', 'finished'):
+        column = getattr(LabOrderItem, f'{step}_at')
+        if status == step:
+            return and_(column != None, *conditions)
+        conditions.append(column == None)
+    return and_(*conditions)
+
+
+def order_item_rows_query(fields=None, statuses=None, start=None, end=None, date_field='received_at',
+                          test_codes=None, hns=None, customer_id=None, latest=False):
+    """Return the query of the order item API rows with the given fields, sorted by id.
+
+    Only the columns of the fields are selected and only the tables they and
+    the filters need are joined, so a page costs one query. The filters are
+    the statuses of ORDER_ITEM_STATUSES, start <= date_field < end, the test
+    codes, the HNs of the patients and the id of a customer. With latest, only
+    the last finished and not cancelled item of each test that matches the
+    filters is kept, ranked with a window function. The id is always selected
+    first. Raises ValueError for unknown fields, statuses or date fields.
+    """
+    approver = aliased(User, name='approver')
+    reporter = aliased(User, name='reporter')
+    available = _order_item_fields(approver, reporter)
+    fields = list(fields or available)
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    if date_field not in ORDER_ITEM_DATE_FIELDS:
+        raise ValueError(f'date_field must be one of {", ".join(ORDER_ITEM_DATE_FIELDS)}')
+    if statuses and not set(statuses) <= set(ORDER_ITEM_STATUSES):
+        raise ValueError(f'status must be one of {", ".join(ORDER_ITEM_STATUSES)}')
+
+    fields = ['id'] + [field for field in fields if field != 'id']
+    joins = {table for field in fields for table in available[field][1]}
+    date_column = LabOrder.received_at if date_field == 'received_at' else getattr(LabOrderItem, date_field)
+    if date_field == 'received_at' and (start or end):
+        joins.add('order')
+    if test_codes:
+        joins.add('test')
+    if hns:
+        joins.update(('order', 'customer'))
+    if customer_id is not None:
+        joins.add('order')
+
+    query = select(*[available[field][0].label(field) for field in fields]).select_from(LabOrderItem)
+    if 'order' in joins:
+        query = query.join(LabOrder, LabOrder.id == LabOrderItem.order_id)
+    if 'customer' in joins:
+        query = query.join(Customer, Customer.id == LabOrder.customer_id)
+    if 'test' in joins:
+        query = query.join(Test, Test.id == LabOrderItem.test_id)
+    if 'approver' in joins:
+        query = query.outerjoin(approver, approver.id == LabOrderItem.approver_id)
+    if 'reporter' in joins:
+        query = query.outerjoin(reporter, reporter.id == LabOrderItem.reporter_id)
+    if statuses:
+        query = query.where(or_(*[order_item_status_filter(status) for status in statuses]))
+    if start:
+        query = query.where(date_column >= start)
+    if end:
+        query = query.where(date_column < end)
+    if test_codes:
+        query = query.where(Test.code.in_(test_codes))
+    if hns:
+        query = query.where(Customer.hn.in_(hns))
+    if customer_id is not None:
+        query = query.where(LabOrder.customer_id == customer_id)
+    if latest:
+        rank = func.row_number().over(partition_by=LabOrderItem.test_id,
+                                      order_by=(LabOrderItem.finished_at.desc(), LabOrderItem.id.desc()))
+        ranked = (query.add_columns(rank.label('rank'))
+                  .where(LabOrderItem.finished_at != None, LabOrderItem.cancelled_at == None)
+                  .subquery())
+        return select(*[ranked.c[field] for field in fields]).where(ranked.c.rank == 1).order_by(ranked.c.id)
+    return query.order_by(LabOrderItem.id)
+
+
+CUSTOMER_FIELDS = ('id', 'hn', 'firstname', 'lastname', 'fullname', 'dob', 'address')
+
+
+def customer_rows_query(fields=None, hns=None, name=None, customer_id=None):
+    """Return the query of the customer API rows with the given fields, sorted by id.
+
+    The fields are those of Customer.to_dict and the id is always selected
+    first. name matches a part of the first or last name and customer_id
+    selects one customer. Raises ValueError for unknown fields.
+    """
+    fields = list(fields or CUSTOMER_FIELDS)
+    unknown = [field for field in fields if field not in CUSTOMER_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    fields = ['id'] + [field for field in fields if field != 'id']
+    fullname = Customer.firstname + ' ' + Customer.lastname
+    query = select(*[(fullname if field == 'fullname' else getattr(Customer, field)).label(field)
+                     for field in fields])
+    if customer_id is not None:
+        query = query.where(Customer.id == customer_id)
+    if hns:
+        query = query.where(Customer.hn.in_(hns))
+    if name:
+        pattern = f'%{name}%'
+        query = query.where(or_(Customer.firstname.like(pattern), Customer.lastname.like(pattern)))
+    return query.order_by(Customer.id)
+
+
+def to_json_row(row):
+    """Return a result row as a dictionary with the dates in ISO format."""
+    return {key: value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+            for key, value in row._mapping.items()}
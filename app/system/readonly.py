@@ -0,0 +1,84 @@
+"""Read-only database access for ad-hoc queries.
+
+The SQL editor runs queries written by users, so it connects with mode=ro and
+query_only instead of going through models.engine. A query can also run against
+a snapshot copy made with the sqlite3 backup API, so long analytical queries
+never hold a read transaction on the live database.
+"""
+import os
+import sqlite3
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+from app.config import DATABASE_URI, config_dict
+
+_engines = {}
+
+
+def database_path(database_uri=DATABASE_URI):
+    return os.path.abspath(make_url(database_uri).database)
+
+
+def connect_readonly(path):
+    uri = f'file:{path}?mode=ro'
+    return sqlite3.connect(uri, uri=True, check_same_thread=False,
+                           timeout=int(config_dict['database']['busy_timeout']) / 1000)
+
+
+def create_readonly_engine(path):
+    _engine = create_engine('sqlite://', creator=lambda: connect_readonly(path))
+
+    @event.listens_for(_engine, 'connect')
+    def set_query_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA query_only=ON')
+        cursor.close()
+
+    return _engine
+
+
+def get_readonly_engine(path):
+    if path not in _engines:
+        _engines[path] = create_readonly_engine(path)
+    return _engines[path]
+
+
+def refresh_snapshot(snapshot_path=None, source_path=None, pages=1024):
+    """Copy the live database to the snapshot file with the online backup API.
+
+    The copy is made in steps of the given number of pages, so writers are only
+    blocked for the duration of one step.
+    """
+    snapshot_path = os.path.abspath(snapshot_path or config_dict['database']['snapshot_path'])
+    source_path = source_path or database_path()
+    if snapshot_path in _engines:
+        _engines.pop(snapshot_path).dispose()
+    source = connect_readonly(source_path)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        source.backup(target, pages=pages)
+        # The snapshot is only read, a rollback journal avoids needing the -wal and -shm files.
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+    return snapshot_path
+
+
+def snapshot_age(snapshot_path=None):
+    snapshot_path = snapshot_path or config_dict['database']['snapshot_path']
+    if not os.path.exists(snapshot_path):
+        return None
+    return time.time() - os.path.getmtime(snapshot_path)
+
+
+def get_query_engine(use_snapshot=False):
+    """Return a read-only engine on the live database or on a snapshot that is not older than snapshot_max_age."""
+    if not use_snapshot:
+        return get_readonly_engine(database_path())
+    age = snapshot_age()
+    if age is None or age > float(config_dict['database']['snapshot_max_age']):
+        refresh_snapshot()
+    return get_readonly_engine(os.path.abspath(config_dict['database']['snapshot_path']))
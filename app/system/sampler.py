@@ -0,0 +1,128 @@
+"""Random rows without ORDER BY random().
+
+A RowSampler keeps the primary keys of a table in a NumPy array and draws
+samples from it, so picking k random customers costs O(k) instead of sorting
+the whole table. The cache is refreshed incrementally with the rows whose id is
+greater than the largest cached id, and reloaded completely after max_age
+seconds to pick up older rows that start to match the filter. Deleted rows are
+detected when they are drawn and dropped from the cache.
+
+Samplers can be used with a Connection or a Session and assume that they are
+always used with the same database.
+"""
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import select
+
+from app.system.models import Customer, Doctor, Test
+
+VERIFY_CHUNK_SIZE = 500
+
+
+class RowSampler:
+    def __init__(self, column, where=None, weight=None, max_age=300):
+        """Sample values of the primary key column of the rows matching where.
+
+        weight is an optional numeric column, rows are then drawn with a
+        probability proportional to it.
+        """
+        self.column = column
+        self.where = where
+        self.weight = weight
+        self.max_age = max_age
+        self._ids = np.empty(0, dtype=np.int64)
+        self._weights = np.empty(0)
+        self._cumulative = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _query(self, *conditions):
+        columns = [self.column] if self.weight is None else [self.column, self.weight]
+        query = select(*columns).where(*conditions).order_by(self.column)
+        if self.where is not None:
+            query = query.where(self.where)
+        return query
+
+    def _set_rows(self, ids, weights):
+        self._ids = ids
+        if self.weight is not None:
+            self._weights = weights
+            self._cumulative = np.cumsum(weights)
+
+    def refresh(self, connection):
+        """Add the new rows to the cache, or reload it when it is older than max_age."""
+        with self._lock:
+            reload = self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age
+            if reload:
+                rows = connection.execute(self._query()).all()
+            elif len(self._ids):
+                rows = connection.execute(self._query(self.column > int(self._ids[-1]))).all()
+            else:
+                rows = connection.execute(self._query()).all()
+            if not rows and not reload:
+                return
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            weights = np.array([row[1] or 0 for row in rows], dtype=float) if self.weight is not None else None
+            if reload:
+                self._set_rows(ids, weights)
+                self._loaded_at = time.monotonic()
+            else:
+                self._set_rows(np.concatenate([self._ids, ids]),
+                               np.concatenate([self._weights, weights]) if weights is not None else None)
+
+    def _missing(self, connection, ids):
+        """Return the ids that no longer match the filter, checking only the given ids."""
+        found = set()
+        for start in range(0, len(ids), VERIFY_CHUNK_SIZE):
+            chunk = ids[start:start + VERIFY_CHUNK_SIZE].tolist()
+            query = select(self.column).where(self.column.in_(chunk))
+            if self.where is not None:
+                query = query.where(self.where)
+            found.update(connection.execute(query).scalars())
+        return [i for i in ids.tolist() if i not in found]
+
+    def _discard(self, ids):
+        with self._lock:
+            keep = ~np.isin(self._ids, ids)
+            self._set_rows(self._ids[keep], self._weights[keep] if self.weight is not None else None)
+
+    def sample(self, connection, k, rng=None):
+        """Return an array of k ids drawn with replacement.
+
+        rng is a numpy.random.Generator. Raises ValueError when there is
+        nothing to sample.
+        """
+        self.refresh(connection)
+        rng = rng if rng is not None else np.random.default_rng()
+        samples = []
+        remaining = k
+        while remaining > 0:
+            ids, cumulative = self._ids, self._cumulative
+            if not len(ids) or (cumulative is not None and cumulative[-1] <= 0):
+                raise ValueError(f'There are no rows to sample in {self.column.class_.__tablename__}.')
+            if cumulative is None:
+                drawn = ids[rng.integers(0, len(ids), size=remaining)]
+            else:
+                drawn = ids[np.searchsorted(cumulative, rng.random(remaining) * cumulative[-1], side='right')]
+            missing = self._missing(connection, np.unique(drawn))
+            if missing:
+                self._discard(missing)
+                drawn = drawn[~np.isin(drawn, missing)]
+            samples.append(drawn)
+            remaining -= len(drawn)
+        return np.concatenate(samples) if samples else np.empty(0, dtype=np.int64)
+
+    def sample_one(self, connection, rng=None):
+        return int(self.sample(connection, 1, rng)[0])
+
+    def ids(self, connection):
+        """Return the cached ids after refreshing them."""
+        self.refresh(connection)
+        return self._ids
+
+
+customer_sampler = RowSampler(Customer.id)
+doctor_sampler = RowSampler(Doctor.id)
+test_sampler = RowSampler(Test.id, Test.active == True)
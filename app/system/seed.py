@@ -0,0 +1,232 @@
+"""Generate synthetic customers, doctors, orders and order items for capacity testing.
+
+Columns are drawn with NumPy in vectorized form, Faker is only used to build a
+small pool of names and addresses that is resampled, and the rows are written in
+chunks with executemany inserts.
+
+    python -m app.system.seed --customers 1000000 --doctors 500 --orders 3000000 --items 10000000 --seed 42
+
+Order items are inserted without SQLAlchemy-Continuum version rows, the first
+version of an item is created when it is updated through the app.
+"""
+import argparse
+import datetime
+import time
+
+import numpy as np
+from faker import Faker
+from sqlalchemy import select, func, insert, bindparam, String
+
+from app.system.models import (engine, Customer, Doctor, Test, LabOrder, LabOrderItem, refresh_order_summary,
+                               bump_table_versions)
+
+NAME_POOL_SIZE = 2000
+ADDRESS_POOL_SIZE = 500
+
+
+def datetime_strings(timestamps):
+    """Convert an array of numpy datetime64 values to the text format SQLAlchemy stores in SQLite."""
+    return np.char.replace(np.datetime_as_string(timestamps, unit='us'), 'T', ' ')
+
+
+def insert_statement(table, columns, text_columns=()):
+    # Date columns are bound as text because they are formatted by NumPy instead of
+    # converting every value to a datetime object.
+    return insert(table).values({col: bindparam(col, type_=String()) if col in text_columns else bindparam(col)
+                                 for col in columns})
+
+
+def write_chunks(bind, statement, columns, num_rows, make_chunk, chunk_size, label):
+    """Insert num_rows rows built by make_chunk(start, stop) and print the progress."""
+    started = time.perf_counter()
+    for start in range(0, num_rows, chunk_size):
+        stop = min(start + chunk_size, num_rows)
+        values = [v.tolist() for v in make_chunk(start, stop)]
+        with bind.begin() as conn:
+            conn.execute(statement, [dict(zip(columns, row)) for row in zip(*values)])
+            bump_table_versions(conn, {statement.table.name})
+        elapsed = time.perf_counter() - started
+        print(f'\r{label}: {stop:,}/{num_rows:,} rows ({stop / elapsed:,.0f} rows/s)', end='', flush=True)
+    if num_rows:
+        print()
+
+
+def next_id(conn, column):
+    return (conn.scalar(select(func.max(column))) or 0) + 1
+
+
+def seed_customers(bind, rng, fake, num_customers, chunk_size):
+    with bind.connect() as conn:
+        first_id = next_id(conn, Customer.id)
+        # The HN is derived from the id, a few random HNs created by initialize_db may fall in the same range.
+        taken = set(conn.scalars(select(Customer.hn).where(Customer.hn >= f'9{first_id:09d}')))
+    firstnames = np.array([fake.first_name() for _ in range(NAME_POOL_SIZE)], dtype=object)
+    lastnames = np.array([fake.last_name() for _ in range(NAME_POOL_SIZE)], dtype=object)
+    addresses = np.array([fake.address() for _ in range(ADDRESS_POOL_SIZE)], dtype=object)
+    genders = np.array(['male', 'female'], dtype=object)
+    today = np.datetime64(datetime.date.today(), 'D')
+
+    def make_chunk(start, stop):
+        n = stop - start
+        ids = np.arange(first_id + start, first_id + stop)
+        hns = np.array([f'9{i:09d}' if f'9{i:09d}' not in taken else f'9{i:09d}-1' for i in ids.tolist()],
+                       dtype=object)
+        dobs = today - rng.integers(365, 90 * 365, size=n).astype('timedelta64[D]')
+        return (ids, hns,
+                firstnames[rng.integers(0, NAME_POOL_SIZE, size=n)],
+                lastnames[rng.integers(0, NAME_POOL_SIZE, size=n)],
+                genders[rng.integers(0, 2, size=n)],
+                np.datetime_as_string(dobs, unit='D'),
+                addresses[rng.integers(0, ADDRESS_POOL_SIZE, size=n)])
+
+    columns = ['id', 'hn', 'firstname', 'lastname', 'gender', 'dob', 'address']
+    statement = insert_statement(Customer.__table__, columns, text_columns=('dob',))
+    write_chunks(bind, statement, columns, num_customers, make_chunk, chunk_size, 'customers')
+
+
+def seed_doctors(bind, rng, fake, num_doctors, chunk_size):
+    with bind.connect() as conn:
+        first_id = next_id(conn, Doctor.id)
+    fullnames = np.array([fake.name() for _ in range(NAME_POOL_SIZE)], dtype=object)
+    genders = np.array(['male', 'female'], dtype=object)
+
+    def make_chunk(start, stop):
+        n = stop - start
+        return (np.arange(first_id + start, first_id + stop),
+                fullnames[rng.integers(0, NAME_POOL_SIZE, size=n)],
+                rng.integers(10 ** 7, 10 ** 8, size=n).astype(str),
+                genders[rng.integers(0, 2, size=n)])
+
+    columns = ['id', 'fullname', 'license_number', 'gender']
+    write_chunks(bind, insert_statement(Doctor.__table__, columns), columns, num_doctors, make_chunk,
+                 chunk_size, 'doctors')
+
+
+def draw_items(rng, num_orders, num_items, num_tests):
+    """Draw the order and test indexes of num_items items, sorted by order.
+
+    An order has each test at most once, like the orders made by generate_orders, so
+    the tests of an order are drawn without replacement. Keeping the items of an order
+    next to each other also keeps them together on disk.
+    """
+    counts = np.bincount(rng.integers(0, num_orders, size=num_items), minlength=num_orders)
+    # An order cannot have more items than there are tests, the excess goes to orders that have room.
+    while excess := int(np.maximum(counts - num_tests, 0).sum()):
+        counts = np.minimum(counts, num_tests)
+        room = np.flatnonzero(counts < num_tests)
+        counts += np.bincount(room[rng.integers(0, len(room), size=excess)], minlength=num_orders)
+    item_orders = np.repeat(np.arange(num_orders), counts)
+    item_tests = rng.integers(0, num_tests, size=num_items)
+    # Draw the repeated tests of an order again until there are none, only the orders that
+    # had a repeated test are checked again.
+    check = np.arange(num_items)
+    while len(check):
+        check = check[np.lexsort((item_tests[check], item_orders[check]))]
+        orders, tests = item_orders[check], item_tests[check]
+        repeated = np.zeros(len(check), dtype=bool)
+        repeated[1:] = (orders[1:] == orders[:-1]) & (tests[1:] == tests[:-1])
+        item_tests[check[repeated]] = rng.integers(0, num_tests, size=int(repeated.sum()))
+        check = check[np.isin(orders, orders[repeated])]
+    return item_orders, item_tests
+
+
+def seed_orders(bind, rng, num_orders, num_items, days, chunk_size):
+    """Insert orders spread over the last number of days and distribute the items over them.
+
+    Most orders are received a few minutes after they are ordered and most of their
+    items are finished, so the database looks like a lab that has been running for a while.
+    """
+    with bind.connect() as conn:
+        customer_ids = np.array(conn.scalars(select(Customer.id)).all())
+        doctor_ids = np.array(conn.scalars(select(Doctor.id)).all())
+        test_ids = np.array(conn.scalars(select(Test.id).where(Test.active == True)).all())
+        first_order_id = next_id(conn, LabOrder.id)
+        first_item_id = next_id(conn, LabOrderItem.id)
+    if num_orders and (not len(customer_ids) or not len(doctor_ids)):
+        raise ValueError('Customers and doctors are required to generate orders.')
+    if num_items and (not num_orders or not len(test_ids)):
+        raise ValueError('Orders and active tests are required to generate order items.')
+    if num_items > num_orders * len(test_ids):
+        raise ValueError(f'{num_orders:,} orders of {len(test_ids)} tests can have at most '
+                         f'{num_orders * len(test_ids):,} items.')
+
+    now = np.datetime64(datetime.datetime.now(), 'us')
+    span = np.timedelta64(days * 24 * 3600, 's').astype('timedelta64[us]').astype(np.int64)
+    order_datetimes = np.sort(now - rng.integers(0, span, size=num_orders).astype('timedelta64[us]'))
+    received = rng.random(num_orders) < 0.95
+    receive_delays = (rng.integers(1, 6, size=num_orders) * 60 * 10 ** 6).astype('timedelta64[us]')
+
+    # Orders made in the last minutes cannot have been received in the future.
+    received_datetimes = np.minimum(order_datetimes + receive_delays, now)
+
+    def make_order_chunk(start, stop):
+        n = stop - start
+        received_at = datetime_strings(received_datetimes[start:stop]).astype(object)
+        received_at[~received[start:stop]] = None
+        return (np.arange(first_order_id + start, first_order_id + stop),
+                customer_ids[rng.integers(0, len(customer_ids), size=n)],
+                doctor_ids[rng.integers(0, len(doctor_ids), size=n)],
+                datetime_strings(order_datetimes[start:stop]),
+                received_at)
+
+    columns = ['id', 'customer_id', 'doctor_id', 'order_datetime', 'received_at']
+    statement = insert_statement(LabOrder.__table__, columns, text_columns=('order_datetime', 'received_at'))
+    write_chunks(bind, statement, columns, num_orders, make_order_chunk, chunk_size, 'orders')
+
+    item_orders, item_tests = draw_items(rng, num_orders, num_items, len(test_ids))
+
+    def make_item_chunk(start, stop):
+        n = stop - start
+        orders = item_orders[start:stop]
+        finished = received[orders] & (rng.random(n) < 0.8)
+        analysis_delays = (rng.integers(5, 41, size=n) * 60 * 10 ** 6).astype('timedelta64[us]')
+        finished_at = datetime_strings(np.minimum(received_datetimes[orders] + analysis_delays, now)).astype(object)
+        finished_at[~finished] = None
+        values = rng.integers(1, 301, size=n).astype(str).astype(object)
+        values[~finished] = None
+        return (np.arange(first_item_id + start, first_item_id + stop),
+                orders + first_order_id,
+                test_ids[item_tests[start:stop]],
+                finished_at,
+                finished_at,
+                values)
+
+    columns = ['id', 'order_id', 'test_id', 'finished_at', 'updated_at', 'value']
+    statement = insert_statement(LabOrderItem.__table__, columns, text_columns=('finished_at', 'updated_at'))
+    write_chunks(bind, statement, columns, len(item_orders), make_item_chunk, chunk_size, 'order items')
+
+    # Core inserts do not trigger the flush events that maintain the order summary.
+    if num_orders:
+        print('Updating the order summary...')
+        with bind.begin() as conn:
+            refresh_order_summary(conn, LabOrder.id >= first_order_id)
+
+
+def seed_db(customers=0, doctors=0, orders=0, items=0, seed=None, days=365, chunk_size=50000, bind=engine):
+    rng = np.random.default_rng(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    seed_customers(bind, rng, fake, customers, chunk_size)
+    seed_doctors(bind, rng, fake, doctors, chunk_size)
+    seed_orders(bind, rng, orders, items, days, chunk_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Populate the database with synthetic data.')
+    parser.add_argument('--customers', type=int, default=0)
+    parser.add_argument('--doctors', type=int, default=0)
+    parser.add_argument('--orders', type=int, default=0)
+    parser.add_argument('--items', type=int, default=0, help='total number of order items')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for reproducible data')
+    parser.add_argument('--days', type=int, default=365, help='spread the orders over this many past days')
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed_db(customers=args.customers, doctors=args.doctors, orders=args.orders, items=args.items,
+            seed=args.seed, days=args.days, chunk_size=args.chunk_size)
+    print(f'Finished in {time.perf_counter() - started:.1f} seconds.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Run the analyzers over the worklist and save the results."""
+import datetime
+import random
+
+from sqlalchemy.orm import Session
+
+from app.config import config_dict
+from app.system.models import engine
+from app.system.queries import load_pending_items
+from app.system.simulation.orders import CHUNK_SIZE
+from app.system.simulation.routing import load_pools, simulate_routed_analysis, STAT, ROUTINE
+
+
+def analyze_pending_items(num_analyzers, rng=random, start_time=None, bind=engine, progress=None, stream=None,
+                          pools=None, chunk_size=CHUNK_SIZE):
+    """Simulate the analyses of the received items that are not finished and save random results.
+
+    The items are routed to the analyzer pools, by default the analyzers of the
+    config or num_analyzers identical analyzers, and the items of STAT orders go first.
+    Returns a dictionary with the start time, the ids, order ids, finish
+    times in minutes and values of the finished items, in the order they
+    finished, and the utilization of the pools. The results are committed every
+    chunk_size items and progress(done, total, message) is called after every
+    item, the chunks that were committed before it raises are kept. The events
+    are added to stream when it is given.
+    """
+    start_time = start_time or datetime.datetime.now()
+    pools = pools if pools is not None else load_pools(config_dict.get('analyzers'), num_analyzers)
+    result = {'start_time': start_time, 'item_ids': [], 'order_ids': [], 'times': [], 'values': []}
+    # The items stay loaded after every commit instead of being read again one by one.
+    with Session(bind, expire_on_commit=False) as session:
+        items = {item.id: item for item in load_pending_items(session)}
+        if progress:
+            progress(0, len(items), 'Analyzing')
+        timeline, result['utilization'] = simulate_routed_analysis(
+            [(item.id, item.test.code, item.test.method.method if item.test.method else None,
+              STAT if item.order.is_stat else ROUTINE) for item in items.values()],
+            pools, rng=rng)
+        for event in timeline:
+            if stream is not None:
+                stream.append(event)
+            if event.kind != 'finished':
+                continue
+            item = items[event.id]
+            item.random_value(rng)
+            finished_at = start_time + datetime.timedelta(minutes=event.time)
+            item.finished_at = finished_at
+            item.updated_at = finished_at
+            result['item_ids'].append(item.id)
+            result['order_ids'].append(item.order_id)
+            result['times'].append(event.time)
+            result['values'].append(item._value)
+            if len(result['item_ids']) % chunk_size == 0:
+                session.commit()
+            if progress:
+                progress(len(result['item_ids']), len(items), 'Saving results')
+        session.commit()
+    return result
@@ -0,0 +1,132 @@
+"""Monte Carlo capacity planning for the reception staff and the analyzers.
+
+Every combination of staff count, analyzer count and arrival rate is simulated
+for a number of replications with the array kernel in queueing.py. The
+replications run in a process pool, each with its own random stream spawned
+from one numpy SeedSequence, so a seed gives the same results with any number
+of workers.
+
+    python -m app.system.simulation.capacity --staff 1 2 3 --analyzers 1 2 4 --rates 5 10 --replications 200 --seed 42
+"""
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.system.simulation.queueing import fifo_schedule
+
+PERCENTILES = [50, 90, 99]
+
+
+def run_replications(num_staff, num_analyzers, arrival_rate, num_orders, max_items, seed_sequences):
+    """Simulate a batch of replications of one scenario.
+
+    Orders arrive as a Poisson process with arrival_rate orders per hour, are
+    received in 1-5 minutes and have 1 to max_items items that take 5-10
+    minutes on an analyzer. Returns the turnaround times of all orders in
+    minutes and the mean staff and analyzer utilization.
+    """
+    tats = []
+    staff_busy = []
+    analyzer_busy = []
+    for seed_sequence in seed_sequences:
+        rng = np.random.default_rng(seed_sequence)
+        arrivals = np.cumsum(rng.exponential(60 / arrival_rate, size=num_orders))
+        receive_durations = rng.integers(1, 6, size=num_orders)
+        received = fifo_schedule(arrivals, receive_durations, num_staff)[1]
+
+        items_per_order = rng.integers(1, max_items + 1, size=num_orders)
+        item_orders = np.repeat(np.arange(num_orders), items_per_order)
+        # Orders do not always finish reception in the order they arrived.
+        queue = np.argsort(received[item_orders], kind='stable')
+        analysis_durations = rng.integers(5, 11, size=len(item_orders))
+        finished = np.empty(len(item_orders))
+        finished[queue] = fifo_schedule(received[item_orders][queue], analysis_durations, num_analyzers)[1]
+
+        order_finished = np.maximum.reduceat(finished, np.cumsum(items_per_order) - items_per_order)
+        tats.append(order_finished - arrivals)
+        span = order_finished.max()
+        staff_busy.append(receive_durations.sum() / (num_staff * span))
+        analyzer_busy.append(analysis_durations.sum() / (num_analyzers * span))
+    return np.concatenate(tats), float(np.mean(staff_busy)), float(np.mean(analyzer_busy))
+
+
+def _run_task(task):
+    return task[0], run_replications(*task[1:])
+
+
+def plan_capacity(staff_counts, analyzer_counts, arrival_rates, replications=100, num_orders=500, max_items=5,
+                  seed=None, max_workers=None, batch_size=25, progress=None):
+    """Return one row per scenario with the TAT percentiles and the utilization.
+
+    Rows are dictionaries with the keys staff, analyzers, arrival_rate, p50, p90,
+    p99 (minutes), staff_utilization and analyzer_utilization. progress(done,
+    total, message) is called after every batch of replications.
+    """
+    scenarios = list(itertools.product(staff_counts, analyzer_counts, arrival_rates))
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(scenarios) * replications)
+    tasks = []
+    for i, (num_staff, num_analyzers, arrival_rate) in enumerate(scenarios):
+        streams = seed_sequences[i * replications:(i + 1) * replications]
+        for start in range(0, replications, batch_size):
+            tasks.append((i, num_staff, num_analyzers, arrival_rate, num_orders, max_items,
+                          streams[start:start + batch_size]))
+
+    results = [([], [], []) for _ in scenarios]
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        for done, (i, (tats, staff_busy, analyzer_busy)) in enumerate(executor.map(_run_task, tasks), 1):
+            results[i][0].append(tats)
+            results[i][1].append(staff_busy)
+            results[i][2].append(analyzer_busy)
+            if progress:
+                progress(done, len(tasks), 'Simulating')
+    finally:
+        # When progress raises, e.g. a cancelled task, the batches that have not started are dropped.
+        executor.shutdown(cancel_futures=True)
+
+    rows = []
+    for (num_staff, num_analyzers, arrival_rate), (tats, staff_busy, analyzer_busy) in zip(scenarios, results):
+        p50, p90, p99 = np.percentile(np.concatenate(tats), PERCENTILES)
+        rows.append({
+            'staff': num_staff,
+            'analyzers': num_analyzers,
+            'arrival_rate': arrival_rate,
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'staff_utilization': float(np.mean(staff_busy)),
+            'analyzer_utilization': float(np.mean(analyzer_busy)),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate turnaround times for staff and analyzer counts.')
+    parser.add_argument('--staff', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--analyzers', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--rates', type=float, nargs='+', default=[5, 10], help='orders per hour')
+    parser.add_argument('--replications', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=500, help='orders per replication')
+    parser.add_argument('--max-items', type=int, default=5, help='maximum number of items per order')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None, help=f'default: {os.cpu_count()}')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = plan_capacity(args.staff, args.analyzers, args.rates, replications=args.replications,
+                         num_orders=args.orders, max_items=args.max_items, seed=args.seed,
+                         max_workers=args.workers)
+    print(f'{"staff":>5} {"analyzers":>9} {"rate/h":>7} {"p50":>8} {"p90":>8} {"p99":>8} {"staff %":>8} {"anlz %":>8}')
+    for row in rows:
+        print(f'{row["staff"]:>5} {row["analyzers"]:>9} {row["arrival_rate"]:>7g} {row["p50"]:>8.1f} '
+              f'{row["p90"]:>8.1f} {row["p99"]:>8.1f} {row["staff_utilization"] * 100:>8.1f} '
+              f'{row["analyzer_utilization"] * 100:>8.1f}')
+    print(f'Finished in {time.perf_counter() - started:.1f} seconds.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Collect simulation events for the event file and the live views.
+
+An EventStream keeps the events in a bounded ring buffer and appends them to a
+JSONL file in batches, one object per line with the run id, the simulated time
+in minutes, the kind, the id and the detail of the event. At the same time it
+keeps running totals that the windows show instead of a line per event:
+the count of every kind, the queue length, the busy servers and their
+utilization.
+
+Events can be appended from a worker thread while the GUI thread reads the
+summary.
+"""
+import collections
+import json
+import threading
+import uuid
+
+EVENT_FILE = 'simulation_events.jsonl'
+
+START_KINDS = {'analyzing', 'receiving'}
+END_KINDS = {'finished', 'received', 'rejected'}
+
+
+class EventStream:
+    def __init__(self, filepath=EVENT_FILE, servers=1, capacity=10000, batch_size=1000):
+        """Write the events to filepath, or only keep the last capacity events when it is None."""
+        self.filepath = filepath
+        self.servers = servers
+        self.batch_size = min(batch_size, capacity)
+        self.run_id = uuid.uuid4().hex[:12]
+        self._buffer = collections.deque(maxlen=capacity)
+        self._unwritten = 0
+        self._lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.now = 0
+        self.busy = 0
+        self._busy_time = 0.0
+
+    def append(self, event):
+        with self._lock:
+            self.counts[event.kind] += 1
+            if event.time > self.now:
+                self._busy_time += self.busy * (event.time - self.now)
+                self.now = event.time
+            if event.kind in START_KINDS:
+                self.busy += 1
+            elif event.kind in END_KINDS:
+                self.busy -= 1
+            self._buffer.append(event)
+            if self.filepath:
+                self._unwritten += 1
+                if self._unwritten >= self.batch_size:
+                    self._flush()
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def _flush(self):
+        if not self._unwritten:
+            return
+        events = list(self._buffer)[-self._unwritten:]
+        with open(self.filepath, 'a') as f:
+            f.writelines(json.dumps({'run': self.run_id, 'time': event.time, 'kind': event.kind,
+                                     'id': event.id, 'detail': event.detail}) + '\n'
+                         for event in events)
+        self._unwritten = 0
+
+    def flush(self):
+        with self._lock:
+            if self.filepath:
+                self._flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def recent(self, n=20):
+        with self._lock:
+            return list(self._buffer)[-n:]
+
+    def summary(self):
+        """Return the current totals of the run as a dictionary."""
+        with self._lock:
+            return {
+                'time': self.now,
+                'counts': dict(self.counts),
+                'queue_length': self.counts['waiting'] - self.counts['analyzing'],
+                'busy': self.busy,
+                'utilization': self._busy_time / (self.servers * self.now) if self.now else 0.0,
+            }
+
+
+def format_summary(summary):
+    counts = ', '.join(f'{kind} {count:,}' for kind, count in sorted(summary['counts'].items()))
+    return (f'Time: {summary["time"]:,} min | Queue: {summary["queue_length"]:,} | Busy: {summary["busy"]:,} | '
+            f'Utilization: {summary["utilization"]:.1%}\n{counts}')
@@ -0,0 +1,116 @@
+"""Headless model of the lab used by the GUI, the Flask API and batch jobs.
+
+The simulations run on a plain simpy.Environment, which jumps from event to
+event as fast as possible. Pass realtime=True to pace the clock with
+simpy.rt.RealtimeEnvironment for demonstrations. Times are in minutes from the
+start of the simulation and the functions only take ids, so they do not touch
+the database.
+
+simulate_reception returns the timeline of the run as a list of SimulationEvent
+tuples in the order they happened. on_event, when given, is called with every
+event as it happens. The analyses are simulated by the analyzer pools in
+routing.py, whose runs that are not paced or watched live are computed with
+the array kernel in queueing.py and returned as a ScheduleTimeline, which keeps
+the times in arrays and only builds the events that are read.
+"""
+import random
+from collections import namedtuple
+from collections.abc import Sequence
+
+import numpy as np
+import simpy
+import simpy.rt
+
+SimulationEvent = namedtuple('SimulationEvent', ['time', 'kind', 'id', 'detail'])
+
+REJECT_REASONS = ['Improper specimens collection', 'Not enough specimens', 'Tests not available']
+
+
+def create_environment(realtime=False, factor=0.1):
+    if realtime:
+        return simpy.rt.RealtimeEnvironment(factor=factor, strict=False)
+    return simpy.Environment()
+
+
+def _recorder(env, timeline, on_event):
+    def record(kind, entity_id, detail=None):
+        event = SimulationEvent(env.now, kind, entity_id, detail)
+        timeline.append(event)
+        if on_event:
+            on_event(event)
+    return record
+
+
+def receive_order(env, order_id, staff, min_duration, max_duration, reject_rate, arrival_delay, rng, record):
+    if arrival_delay:
+        yield env.timeout(arrival_delay)
+    with staff.request() as req:
+        yield req
+        record('receiving', order_id)
+        rejected = rng.random() < reject_rate
+        yield env.timeout(rng.randint(min_duration, max_duration))
+    if rejected:
+        record('rejected', order_id, rng.choice(REJECT_REASONS))
+    else:
+        record('received', order_id)
+
+
+def simulate_reception(order_ids, num_staff, min_duration=1, max_duration=5, reject_rate=0.05,
+                       arrival_delay=0, realtime=False, rng=random, on_event=None):
+    """Simulate num_staff receptionists checking the orders in FIFO order.
+
+    Each order ends with a 'received' or 'rejected' event, the detail of a
+    rejection is the reason.
+    """
+    env = create_environment(realtime)
+    staff = simpy.Resource(env, capacity=num_staff)
+    timeline = []
+    record = _recorder(env, timeline, on_event)
+    for order_id in order_ids:
+        env.process(receive_order(env, order_id, staff, min_duration, max_duration,
+                                  reject_rate, arrival_delay, rng, record))
+    env.run()
+    return timeline
+
+
+class ScheduleTimeline(Sequence):
+    """The timeline of items that all wait from time 0 and are analyzed at the given times.
+
+    The times are kept in arrays and a SimulationEvent is only built when it is
+    read, so scheduling a large batch does not create a tuple per event.
+    """
+    kinds = ('waiting', 'analyzing', 'finished')
+
+    def __init__(self, items, starts, finishes, indexes=None):
+        """starts[i] and finishes[i] are the times of items[indexes[i]], or of items[i] without indexes.
+
+        items are (item id, detail) pairs or longer tuples starting with them.
+        """
+        n = len(starts)
+        times = np.concatenate([np.zeros(n, dtype=np.int64), starts, finishes])
+        # Finished analyses free an analyzer before the next one starts at the same time.
+        ranks = np.repeat(np.array([0, 2, 1], dtype=np.int8), n)
+        self._positions = np.lexsort((ranks, times))
+        self._times = times[self._positions]
+        self._n = n
+        self.items = items
+        self.indexes = None if indexes is None else np.asarray(indexes).tolist()
+        self.starts = starts
+        self.finishes = finishes
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _event(self, time, position):
+        index = position % self._n
+        item = self.items[index if self.indexes is None else self.indexes[index]]
+        return SimulationEvent(time, self.kinds[position // self._n], item[0], item[1])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._event(int(self._times[i]), int(self._positions[i]))
+
+    def __iter__(self):
+        for time, position in zip(self._times.tolist(), self._positions.tolist()):
+            yield self._event(time, position)
@@ -0,0 +1,140 @@
+"""Generate simulated lab orders in bulk.
+
+The orders and their items are built in memory from ids drawn by the row
+samplers, inserted with executemany in one transaction per chunk and then
+received or rejected with executemany UPDATEs, so a large batch neither scans
+the customers table per order nor commits per order.
+
+Order items are inserted without SQLAlchemy-Continuum version rows, the first
+version of an item is created when it is updated through the app.
+"""
+import datetime
+import random
+
+import numpy as np
+from sqlalchemy import insert, update, bindparam
+
+from app.system.models import engine, LabOrder, LabOrderItem, refresh_order_summary
+from app.system.sampler import customer_sampler, doctor_sampler, test_sampler
+from app.system.simulation.lab import simulate_reception
+
+CHUNK_SIZE = 500
+
+
+def build_orders(customer_ids, doctor_ids, test_ids, tests_per_order, order_datetime, is_stat=None):
+    """Return the order rows and the distinct tests of each order.
+
+    test_ids holds the tests drawn for all orders, tests_per_order[i] of them for order i.
+    is_stat flags the STAT orders, all orders are routine by default.
+    """
+    if is_stat is None:
+        is_stat = np.zeros(len(customer_ids), dtype=bool)
+    orders = [{'customer_id': customer_id, 'doctor_id': doctor_id, 'order_datetime': order_datetime,
+               'is_stat': stat}
+              for customer_id, doctor_id, stat in zip(customer_ids.tolist(), doctor_ids.tolist(), is_stat.tolist())]
+    order_tests = [sorted(set(tests.tolist())) for tests in np.split(test_ids, np.cumsum(tests_per_order)[:-1])]
+    return orders, order_tests
+
+
+def insert_orders(orders, order_tests, bind=engine, chunk_size=CHUNK_SIZE, progress=None, order_ids=None):
+    """Insert the orders and their items and return the ids of the orders.
+
+    The orders get the next free ids unless order_ids are given, e.g. when a recorded run is replayed.
+    """
+    given_ids = order_ids
+    order_ids = []
+    for start in range(0, len(orders), chunk_size):
+        chunk = orders[start:start + chunk_size]
+        with bind.begin() as conn:
+            if given_ids is not None:
+                ids = list(given_ids[start:start + chunk_size])
+                conn.execute(insert(LabOrder), [{'id': order_id, **order} for order_id, order in zip(ids, chunk)])
+            else:
+                # Inserting the first order locks the database for writing, so no other
+                # connection can take the ids that follow it before this chunk is committed.
+                first_id = conn.execute(insert(LabOrder), chunk[0]).inserted_primary_key[0]
+                ids = list(range(first_id, first_id + len(chunk)))
+                if len(chunk) > 1:
+                    conn.execute(insert(LabOrder), [{'id': order_id, **order}
+                                                    for order_id, order in zip(ids[1:], chunk[1:])])
+            items = [{'order_id': order_id, 'test_id': test_id}
+                     for order_id, test_ids in zip(ids, order_tests[start:start + chunk_size])
+                     for test_id in test_ids]
+            if items:
+                conn.execute(insert(LabOrderItem), items)
+            # Core inserts do not trigger the flush events that maintain the order summary.
+            refresh_order_summary(conn, LabOrder.id.between(min(ids), max(ids)))
+        order_ids.extend(ids)
+        if progress:
+            progress(len(order_ids), len(orders), 'Ordering')
+    return order_ids
+
+
+def apply_reception(timeline, order_datetime, receiver_id=None, bind=engine, chunk_size=CHUNK_SIZE, progress=None):
+    """Save the received and rejected events of a reception timeline to the orders."""
+    received = [{'order_id': event.id,
+                 'received_at': order_datetime + datetime.timedelta(minutes=event.time),
+                 'receiver_id': receiver_id}
+                for event in timeline if event.kind == 'received']
+    rejected = [{'order_id': event.id,
+                 'rejected_at': order_datetime + datetime.timedelta(minutes=event.time),
+                 'rejector_id': receiver_id,
+                 'reason': event.detail}
+                for event in timeline if event.kind == 'rejected']
+    table = LabOrder.__table__
+    receive_statement = update(table).where(table.c.id == bindparam('order_id')).values(
+        received_at=bindparam('received_at'), receiver_id=bindparam('receiver_id'))
+    reject_statement = update(table).where(table.c.id == bindparam('order_id')).values(
+        rejected_at=bindparam('rejected_at'), rejector_id=bindparam('rejector_id'), reason=bindparam('reason'))
+    done = 0
+    for statement, rows in ((receive_statement, received), (reject_statement, rejected)):
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            with bind.begin() as conn:
+                conn.execute(statement, chunk)
+                refresh_order_summary(conn, LabOrder.id.in_([row['order_id'] for row in chunk]))
+            done += len(chunk)
+            if progress:
+                progress(done, len(received) + len(rejected), 'Receiving')
+    return len(received), len(rejected)
+
+
+def generate_orders(num_orders, auto_receive=False, receiver_id=None, num_staff=1, bind=engine,
+                    chunk_size=CHUNK_SIZE, rng=random, progress=None, stream=None, stat_rate=0.1):
+    """Create num_orders orders for random customers and doctors and optionally receive them.
+
+    About stat_rate of the orders are STAT orders. Returns a dictionary with the
+    ids of the new orders, their order time, customers, doctors, tests and STAT
+    flags, the reception timeline and the number of received and rejected
+    orders. progress(done, total, message) is called after every chunk, the
+    chunks that were written before it raises are kept.
+    The reception events are added to stream when it is given.
+    """
+    np_rng = np.random.default_rng(rng.getrandbits(64))
+    with bind.connect() as conn:
+        num_tests = len(test_sampler.ids(conn))
+        if not num_tests:
+            raise ValueError('Add some tests first.')
+        try:
+            customer_ids = customer_sampler.sample(conn, num_orders, np_rng)
+            doctor_ids = doctor_sampler.sample(conn, num_orders, np_rng)
+        except ValueError:
+            raise ValueError('Add some customers and doctors first.')
+        tests_per_order = np_rng.integers(1, num_tests + 1, size=num_orders)
+        test_ids = test_sampler.sample(conn, int(tests_per_order.sum()), np_rng)
+    is_stat = np_rng.random(num_orders) < stat_rate
+
+    order_datetime = datetime.datetime.now()
+    orders, order_tests = build_orders(customer_ids, doctor_ids, test_ids, tests_per_order, order_datetime, is_stat)
+    order_ids = insert_orders(orders, order_tests, bind, chunk_size, progress)
+    result = {'order_ids': order_ids, 'order_datetime': order_datetime, 'customer_ids': customer_ids,
+              'doctor_ids': doctor_ids, 'order_tests': order_tests, 'is_stat': is_stat, 'timeline': [],
+              'received': 0, 'rejected': 0}
+    if auto_receive and order_ids:
+        timeline = simulate_reception(order_ids, num_staff, 1, 5, rng=rng)
+        if stream is not None:
+            stream.extend(timeline)
+        result['timeline'] = timeline
+        result['received'], result['rejected'] = apply_reception(timeline, order_datetime, receiver_id,
+                                                                 bind, chunk_size, progress)
+    return result
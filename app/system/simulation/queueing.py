@@ -0,0 +1,46 @@
+"""Array based FIFO queues with identical servers.
+
+These compute the same start and finish times as a simpy.Resource with the
+given capacity when every job requests the resource at its arrival time and
+holds it for its duration, without creating a process per job.
+"""
+import heapq
+
+import numpy as np
+
+
+def fifo_schedule(arrivals, durations, servers=1):
+    """Return the start and finish times of jobs served first come, first served by identical servers.
+
+    arrivals must be sorted in ascending order, ties are served in the order of
+    the arrays. A single server uses the Lindley recursion
+    finish[i] = max(arrivals[i], finish[i - 1]) + durations[i], which is
+    evaluated with a cumulative maximum. More servers take the next job from a
+    heap of the times the servers become free.
+    """
+    arrivals = np.asarray(arrivals)
+    durations = np.asarray(durations)
+    if arrivals.shape != durations.shape or arrivals.ndim != 1:
+        raise ValueError('arrivals and durations must be one dimensional arrays of the same length.')
+    if servers < 1:
+        raise ValueError('At least one server is required.')
+    if len(arrivals) and np.any(np.diff(arrivals) < 0):
+        raise ValueError('arrivals must be sorted.')
+    if servers == 1:
+        # With S[i] = durations[0] + ... + durations[i], finish[i] - S[i] is the running
+        # maximum of arrivals[i] - S[i - 1].
+        total = np.cumsum(durations)
+        finishes = np.maximum.accumulate(arrivals - (total - durations)) + total
+        return finishes - durations, finishes
+    if len(arrivals) <= servers:
+        return arrivals.copy(), arrivals + durations
+    # The first jobs go straight to a free server.
+    starts = arrivals[:servers].tolist()
+    free_at = (arrivals[:servers] + durations[:servers]).tolist()
+    heapq.heapify(free_at)
+    for arrival, duration in zip(arrivals[servers:].tolist(), durations[servers:].tolist()):
+        start = arrival if arrival > free_at[0] else free_at[0]
+        starts.append(start)
+        heapq.heapreplace(free_at, start + duration)
+    starts = np.array(starts)
+    return starts, starts + durations
@@ -0,0 +1,159 @@
+"""Record seeded simulation runs and replay them into another database.
+
+A run generates and receives orders and then analyzes the worklist with one
+random.Random seeded with the run seed, so the same seed on the same database
+gives the same run. The recording stores the outcome of the run as NumPy
+arrays in a compressed .npz file: the orders with their customers, doctors and
+tests, the reception events and the finished items with their values. Replaying
+writes these rows with executemany statements without running the model.
+
+    python -m app.system.simulation.recording record run.npz --orders 1000 --staff 2 --analyzers 2 --seed 42
+    python -m app.system.simulation.recording replay run.npz --database copy.db
+
+The database a recording is replayed into must have the same customers,
+doctors, tests and pending items as the one it was recorded on. Replayed items
+have no SQLAlchemy-Continuum version rows.
+"""
+import argparse
+import datetime
+import random
+import time
+
+import numpy as np
+from sqlalchemy import update, bindparam
+
+from app.system.models import engine, create_db_engine, LabOrder, LabOrderItem, refresh_order_summary
+from app.system.simulation.analysis import analyze_pending_items
+from app.system.simulation.lab import SimulationEvent, REJECT_REASONS
+from app.system.simulation.orders import generate_orders, insert_orders, apply_reception, CHUNK_SIZE
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_microseconds(value):
+    return (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_microseconds(value):
+    return EPOCH + datetime.timedelta(microseconds=int(value))
+
+
+def simulate_run(num_orders, num_staff=1, num_analyzers=1, seed=None, receiver_id=None, bind=engine):
+    """Generate, receive and analyze orders with the seed and return the recording of the run."""
+    rng = random.Random(seed)
+    orders = generate_orders(num_orders, auto_receive=True, receiver_id=receiver_id, num_staff=num_staff,
+                             bind=bind, rng=rng)
+    analysis = analyze_pending_items(num_analyzers, rng=rng, bind=bind)
+    return make_recording(orders, analysis, receiver_id, seed)
+
+
+def make_recording(orders, analysis, receiver_id=None, seed=None):
+    """Convert the results of generate_orders and analyze_pending_items to a dictionary of arrays."""
+    events = [event for event in orders['timeline'] if event.kind in ('received', 'rejected')]
+    values = analysis['values']
+    return {
+        'seed': np.array(-1 if seed is None else seed, dtype=np.int64),
+        'receiver_id': np.array(-1 if receiver_id is None else receiver_id, dtype=np.int64),
+        'order_datetime': np.array(to_microseconds(orders['order_datetime']), dtype=np.int64),
+        'order_ids': np.array(orders['order_ids'], dtype=np.int64),
+        'customer_ids': np.asarray(orders['customer_ids'], dtype=np.int64),
+        'doctor_ids': np.asarray(orders['doctor_ids'], dtype=np.int64),
+        'tests_per_order': np.array([len(tests) for tests in orders['order_tests']], dtype=np.int64),
+        'test_ids': np.array([test_id for tests in orders['order_tests'] for test_id in tests], dtype=np.int64),
+        'is_stat': np.asarray(orders['is_stat'], dtype=bool),
+        'event_order_ids': np.array([event.id for event in events], dtype=np.int64),
+        'event_times': np.array([event.time for event in events], dtype=np.int64),
+        'event_reasons': np.array([REJECT_REASONS.index(event.detail) if event.kind == 'rejected' else -1
+                                   for event in events], dtype=np.int8),
+        'analysis_start_time': np.array(to_microseconds(analysis['start_time']), dtype=np.int64),
+        'item_ids': np.array(analysis['item_ids'], dtype=np.int64),
+        'item_order_ids': np.array(analysis['order_ids'], dtype=np.int64),
+        'item_times': np.array(analysis['times'], dtype=np.int64),
+        'item_values': np.array(['' if value is None else value for value in values], dtype=str),
+        'item_has_value': np.array([value is not None for value in values], dtype=bool),
+    }
+
+
+def save_recording(filepath, recording):
+    np.savez_compressed(filepath, **recording)
+
+
+def load_recording(filepath):
+    with np.load(filepath) as data:
+        return {key: data[key] for key in data.files}
+
+
+def replay(recording, bind=engine, chunk_size=CHUNK_SIZE):
+    """Write the orders, reception and analysis results of a recording to the database."""
+    order_datetime = from_microseconds(recording['order_datetime'])
+    # Recordings made before STAT orders only have routine orders.
+    is_stat = recording.get('is_stat', np.zeros(len(recording['order_ids']), dtype=bool))
+    orders = [{'customer_id': customer_id, 'doctor_id': doctor_id, 'order_datetime': order_datetime,
+               'is_stat': stat}
+              for customer_id, doctor_id, stat in zip(recording['customer_ids'].tolist(),
+                                                      recording['doctor_ids'].tolist(), is_stat.tolist())]
+    bounds = np.cumsum(recording['tests_per_order'])[:-1]
+    order_tests = [tests.tolist() for tests in np.split(recording['test_ids'], bounds)] if len(orders) else []
+    insert_orders(orders, order_tests, bind, chunk_size, order_ids=recording['order_ids'].tolist())
+
+    receiver_id = int(recording['receiver_id'])
+    receiver_id = None if receiver_id < 0 else receiver_id
+    timeline = [SimulationEvent(event_time, 'received' if reason < 0 else 'rejected', order_id,
+                                REJECT_REASONS[reason] if reason >= 0 else None)
+                for order_id, event_time, reason in zip(recording['event_order_ids'].tolist(),
+                                                        recording['event_times'].tolist(),
+                                                        recording['event_reasons'].tolist())]
+    apply_reception(timeline, order_datetime, receiver_id, bind, chunk_size)
+
+    start_time = from_microseconds(recording['analysis_start_time'])
+    items = [{'item_id': item_id,
+              'finished_at': start_time + datetime.timedelta(minutes=item_time),
+              'value': value if has_value else None}
+             for item_id, item_time, value, has_value in zip(recording['item_ids'].tolist(),
+                                                             recording['item_times'].tolist(),
+                                                             recording['item_values'].tolist(),
+                                                             recording['item_has_value'].tolist())]
+    table = LabOrderItem.__table__
+    statement = update(table).where(table.c.id == bindparam('item_id')).values(
+        finished_at=bindparam('finished_at'), updated_at=bindparam('finished_at'), value=bindparam('value'))
+    item_order_ids = recording['item_order_ids']
+    for start in range(0, len(items), chunk_size):
+        with bind.begin() as conn:
+            conn.execute(statement, items[start:start + chunk_size])
+            order_ids = np.unique(item_order_ids[start:start + chunk_size]).tolist()
+            refresh_order_summary(conn, LabOrder.id.in_(order_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record a seeded simulation run or replay a recording.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='simulate a run and save its recording')
+    record_parser.add_argument('filepath')
+    record_parser.add_argument('--orders', type=int, default=100)
+    record_parser.add_argument('--staff', type=int, default=1)
+    record_parser.add_argument('--analyzers', type=int, default=1)
+    record_parser.add_argument('--seed', type=int, default=None)
+    record_parser.add_argument('--receiver-id', type=int, default=None)
+    record_parser.add_argument('--database', help='SQLite file, the app database by default')
+    replay_parser = subparsers.add_parser('replay', help='write a recording to a database')
+    replay_parser.add_argument('filepath')
+    replay_parser.add_argument('--database', help='SQLite file, the app database by default')
+    args = parser.parse_args()
+
+    bind = create_db_engine(f'sqlite:///{args.database}') if args.database else engine
+    started = time.perf_counter()
+    if args.command == 'record':
+        recording = simulate_run(args.orders, args.staff, args.analyzers, args.seed, args.receiver_id, bind)
+        save_recording(args.filepath, recording)
+        print(f'Recorded {len(recording["order_ids"]):,} orders and {len(recording["item_ids"]):,} '
+              f'finished items to {args.filepath}.')
+    else:
+        recording = load_recording(args.filepath)
+        replay(recording, bind)
+        print(f'Replayed {len(recording["order_ids"]):,} orders and {len(recording["item_ids"]):,} '
+              f'finished items.')
+    print(f'Finished in {time.perf_counter() - started:.1f} seconds.')
+
+
+if __name__ == '__main__':
+    main()
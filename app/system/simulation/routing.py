@@ -0,0 +1,205 @@
+"""Route the analyses to pools of analyzers.
+
+Each AnalyzerPool stands for the instruments of one type, e.g. the chemistry
+analyzers, with their number, the run time of a batch in minutes and the number
+of items they run together. A test goes to the pool that lists its code, then
+to the pool that lists its method and otherwise to the first pool that lists
+neither. The pools are read from the analyzers section of config.yaml:
+
+    analyzers:
+    - name: Chemistry
+      count: 2
+      min_duration: 5
+      max_duration: 10
+      methods: [Enzymatic]
+    - name: HbA1c
+      count: 1
+      min_duration: 3
+      max_duration: 4
+      batch_size: 10
+      codes: [HBA1C]
+
+The pools run at the same time and every pool takes its batches from a
+simpy.PriorityResource, so the items of STAT orders are analyzed before the
+routine ones. STAT and routine items are never run in the same batch.
+"""
+import random
+from collections import namedtuple
+
+import numpy as np
+import simpy
+
+from app.system.simulation.lab import ScheduleTimeline, create_environment, _recorder
+from app.system.simulation.queueing import fifo_schedule
+
+AnalyzerPool = namedtuple('AnalyzerPool', ['name', 'count', 'min_duration', 'max_duration', 'batch_size',
+                                           'methods', 'codes'])
+
+STAT = 0
+ROUTINE = 1
+
+
+def load_pools(configs, num_analyzers=1, min_duration=5, max_duration=10):
+    """Return the AnalyzerPool list of the analyzers config.
+
+    Without configs all tests run on one pool of num_analyzers analyzers.
+    Raises ValueError when a pool is not valid.
+    """
+    if not configs:
+        return [AnalyzerPool('General', num_analyzers, min_duration, max_duration, 1, (), ())]
+    pools = []
+    for config in configs:
+        pool = AnalyzerPool(name=str(config['name']),
+                            count=int(config.get('count', 1)),
+                            min_duration=int(config.get('min_duration', min_duration)),
+                            max_duration=int(config.get('max_duration', max_duration)),
+                            batch_size=int(config.get('batch_size', 1)),
+                            methods=tuple(config.get('methods') or ()),
+                            codes=tuple(config.get('codes') or ()))
+        if pool.count < 1 or pool.batch_size < 1:
+            raise ValueError(f'The {pool.name} pool needs at least one analyzer and a batch size of at least 1.')
+        if not 0 <= pool.min_duration <= pool.max_duration:
+            raise ValueError(f'The durations of the {pool.name} pool are not valid.')
+        if pool.name in {p.name for p in pools}:
+            raise ValueError(f'There is more than one {pool.name} pool.')
+        pools.append(pool)
+    return pools
+
+
+def route_items(items, pools):
+    """Return an array with the index of the pool of each (item id, code, method, priority) item.
+
+    Raises ValueError when an item has no pool.
+    """
+    by_code = {}
+    by_method = {}
+    default = None
+    for i, pool in enumerate(pools):
+        for code in pool.codes:
+            by_code.setdefault(code, i)
+        for method in pool.methods:
+            by_method.setdefault(method, i)
+        if default is None and not pool.codes and not pool.methods:
+            default = i
+    routes = {}
+    for code, method in {(item[1], item[2]) for item in items}:
+        pool_index = by_code.get(code, by_method.get(method, default))
+        if pool_index is None:
+            raise ValueError(f'There is no analyzer for {code}.')
+        routes[code, method] = pool_index
+    return np.array([routes[item[1], item[2]] for item in items], dtype=np.int64)
+
+
+def _batches(queue, priorities, batch_size):
+    """Split the item indexes of a pool into batches, STAT items first.
+
+    Returns the indexes in the order they are run, the size of every batch and its priority.
+    """
+    queue_priorities = priorities[queue]
+    order = queue[np.argsort(queue_priorities, kind='stable')]
+    sizes = []
+    batch_priorities = []
+    for priority in (STAT, ROUTINE):
+        full, rest = divmod(int(np.count_nonzero(queue_priorities == priority)), batch_size)
+        sizes.append(np.full(full, batch_size, dtype=np.int64))
+        if rest:
+            sizes.append(np.array([rest], dtype=np.int64))
+        batch_priorities.extend([priority] * (full + bool(rest)))
+    return order, np.concatenate(sizes), batch_priorities
+
+
+def simulate_routed_analysis(items, pools, realtime=False, rng=random, on_event=None):
+    """Simulate the pools running the (item id, test code, test method, priority) items.
+
+    priority is STAT or ROUTINE. Returns the timeline and a dictionary with the
+    number of analyzers, items and batches, the busy time in minutes, the time
+    the last batch finished and the utilization of every pool. The utilization
+    is the busy time over the time all analyzers of the pool were available
+    until the whole run finished, so the bottleneck is the pool closest to 100%.
+    """
+    items = list(items)
+    pool_indexes = route_items(items, pools)
+    priorities = np.array([item[3] for item in items], dtype=np.int64)
+    # Every pool draws from its own generator, so the pools do not change each other's durations.
+    rngs = [random.Random(rng.getrandbits(64)) for _ in pools]
+    batches = [_batches(np.flatnonzero(pool_indexes == i), priorities, pool.batch_size)
+               for i, pool in enumerate(pools)]
+    if not realtime and on_event is None:
+        timeline, busy, finished = _routed_timeline(items, pools, batches, rngs)
+    else:
+        timeline, busy, finished = _simulate_pools(items, pools, batches, rngs, realtime, on_event)
+    end = max(finished, default=0)
+    utilization = {}
+    for pool, (order, sizes, _), pool_busy, pool_finished in zip(pools, batches, busy, finished):
+        utilization[pool.name] = {
+            'count': pool.count,
+            'items': len(order),
+            'batches': len(sizes),
+            'busy_time': pool_busy,
+            'finished_at': pool_finished,
+            'utilization': pool_busy / (pool.count * end) if end else 0.0,
+        }
+    return timeline, utilization
+
+
+def analyze_batch(env, batch, priority, instrument, min_duration, max_duration, rng, record, busy):
+    for item_id, code in batch:
+        record('waiting', item_id, code)
+    with instrument.request(priority=priority) as req:
+        yield req
+        for item_id, code in batch:
+            record('analyzing', item_id, code)
+        duration = rng.randint(min_duration, max_duration)
+        busy.append(duration)
+        yield env.timeout(duration)
+    for item_id, code in batch:
+        record('finished', item_id, code)
+
+
+def _simulate_pools(items, pools, batches, rngs, realtime, on_event):
+    env = create_environment(realtime)
+    timeline = []
+    record = _recorder(env, timeline, on_event)
+    busy = []
+    for pool, (order, sizes, batch_priorities), pool_rng in zip(pools, batches, rngs):
+        instrument = simpy.PriorityResource(env, capacity=pool.count)
+        pool_busy = []
+        busy.append(pool_busy)
+        for priority, indexes in zip(batch_priorities, np.split(order, np.cumsum(sizes)[:-1])):
+            batch = [(items[i][0], items[i][1]) for i in indexes.tolist()]
+            env.process(analyze_batch(env, batch, priority, instrument, pool.min_duration, pool.max_duration,
+                                      pool_rng, record, pool_busy))
+    env.run()
+    last = {}
+    for event in timeline:
+        if event.kind == 'finished':
+            last[event.id] = event.time
+    finished = [max((last[items[i][0]] for i in order.tolist()), default=0) for order, _, _ in batches]
+    return timeline, [sum(pool_busy) for pool_busy in busy], finished
+
+
+def _routed_timeline(items, pools, batches, rngs):
+    # All batches are waiting at the start and a pool starts them in the order of the priority queue,
+    # which is the order of its batches, so every pool is a FIFO queue of its batches.
+    empty = np.empty(0, dtype=np.int64)
+    orders, starts, finishes = [empty], [empty], [empty]
+    busy, finished = [], []
+    for pool, (order, sizes, _), pool_rng in zip(pools, batches, rngs):
+        durations = np.array([pool_rng.randint(pool.min_duration, pool.max_duration) for _ in range(len(sizes))],
+                             dtype=np.int64)
+        batch_starts, batch_finishes = fifo_schedule(np.zeros_like(durations), durations, pool.count)
+        orders.append(order)
+        starts.append(np.repeat(batch_starts, sizes))
+        finishes.append(np.repeat(batch_finishes, sizes))
+        busy.append(int(durations.sum()))
+        finished.append(int(batch_finishes.max()) if len(durations) else 0)
+    timeline = ScheduleTimeline(items, np.concatenate(starts), np.concatenate(finishes), np.concatenate(orders))
+    return timeline, busy, finished
+
+
+def format_utilization(utilization):
+    """Return one line per pool, the busiest pool first."""
+    pools = sorted(utilization.items(), key=lambda pool: pool[1]['utilization'], reverse=True)
+    return '\n'.join(f'{name}: {pool["utilization"]:.1%} of {pool["count"]} analyzer(s), {pool["items"]:,} items '
+                     f'in {pool["batches"]:,} batches, done at {pool["finished_at"]:,} min'
+                     for name, pool in pools)
@@ -0,0 +1,20 @@
+"""Rebuild the lab_order_summary table from the orders and their items.
+
+The table is kept up to date while the app runs. A rebuild is only needed for
+databases changed outside of the app, for example by bulk inserts.
+
+    python -m app.system.summary
+"""
+import time
+
+from app.system.models import rebuild_order_summary
+
+
+def main():
+    started = time.perf_counter()
+    num_orders = rebuild_order_summary()
+    print(f'Rebuilt the summary of {num_orders:,} orders in {time.perf_counter() - started:.1f} seconds.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Run long operations of the GUI in worker threads.
+
+start_task runs a function in a thread pool and reports back to the window
+with window.write_event_value, so the window keeps repainting while the work
+runs. The events are tuples of the task key and one of
+
+    'progress'   values[event] is (done, total, message)
+    'done'       values[event] is the return value
+    'error'      values[event] is the exception
+    'cancelled'  values[event] is None
+
+The function receives the Task as its first argument. Calling task.progress
+posts a progress event and raises TaskCancelled once the task is cancelled,
+so loops only need to report their progress to be cancellable. Work must not
+touch the widgets, that is done by the window loop when the events arrive.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='task')
+
+PROGRESS_INTERVAL = 0.1
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, window, key):
+        self.window = window
+        self.key = key
+        self.future = None
+        self._cancelled = threading.Event()
+        self._cancel_callbacks = []
+        self._last_progress = 0.0
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+    def cancel(self):
+        """Ask the task to stop at its next progress report and call the cancel callbacks."""
+        self._cancelled.set()
+        for callback in list(self._cancel_callbacks):
+            callback()
+
+    def stop(self, timeout=10):
+        """Cancel the task and wait for it to finish, before closing its window."""
+        if self.running:
+            self.cancel()
+            wait([self.future], timeout)
+
+    def on_cancel(self, callback):
+        """Call callback from the GUI thread when the task is cancelled, e.g. to interrupt a query."""
+        self._cancel_callbacks.append(callback)
+        if self.cancelled:
+            callback()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def progress(self, done, total=None, message=''):
+        """Report the progress, at most every PROGRESS_INTERVAL seconds except for the last step."""
+        self.check_cancelled()
+        now = time.monotonic()
+        if now - self._last_progress >= PROGRESS_INTERVAL or done == total:
+            self._last_progress = now
+            self.window.write_event_value((self.key, 'progress'), (done, total, message))
+
+    def _run(self, func, args, kwargs):
+        try:
+            result = func(self, *args, **kwargs)
+        except Exception as e:
+            if self.cancelled:
+                self.window.write_event_value((self.key, 'cancelled'), None)
+            else:
+                self.window.write_event_value((self.key, 'error'), e)
+        else:
+            self.window.write_event_value((self.key, 'done'), result)
+
+
+def start_task(window, key, func, *args, **kwargs):
+    """Run func(task, *args, **kwargs) in a worker thread and return the Task."""
+    task = Task(window, key)
+    # Run in a copy of the current context so that the SQL statistics are counted for the open window.
+    context = contextvars.copy_context()
+    task.future = _executor.submit(context.run, task._run, func, args, kwargs)
+    return task
+
+
+def format_progress(done, total, message=''):
+    text = f'{message} ' if message else ''
+    if total:
+        return f'{text}{done:,}/{total:,} ({done / total:.0%})'
+    return f'{text}{done:,}'
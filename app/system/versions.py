@@ -0,0 +1,35 @@
+"""Version counters of tables for conditional GET requests.
+
+The versions are kept in the table_versions table. The session events in
+models.py bump the versions of the tables of the objects written by every ORM
+flush, including objects whose many-to-many collections changed, and of the
+ORM-enabled INSERT, UPDATE and DELETE statements, in the same transaction as
+the writes. The seed command bumps the tables it writes with Core. A response
+built from some tables can then be identified by their versions with one small
+query, whichever process or worker made the last change:
+
+    etag, last_modified = table_versions(db.session, 'tests', 'test_methods', 'specimens')
+
+Other Core statements executed on a Connection, e.g. the order generation, do
+not bump the versions.
+"""
+import datetime
+
+from sqlalchemy import select
+
+from app.system.models import TableVersion
+
+
+def table_versions(bind, *tables):
+    """Return the unquoted ETag and the last modified time of the data of the tables.
+
+    bind is a Session or Connection. The last modified time is None when none of
+    the tables has been written yet.
+    """
+    rows = {name: (version, modified_at) for name, version, modified_at in bind.execute(
+        select(TableVersion.table_name, TableVersion.version, TableVersion.modified_at)
+        .where(TableVersion.table_name.in_(tables)))}
+    etag = '.'.join(str(rows.get(table, (0, None))[0]) for table in tables)
+    modified = [modified_at for _, modified_at in rows.values()]
+    last_modified = max(modified).replace(tzinfo=datetime.timezone.utc) if modified else None
+    return etag, last_modified
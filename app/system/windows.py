@@ -4,15 +4,23 @@ import datetime
 import FreeSimpleGUI as sg
 import pandas as pd
 import requests
-import simpy
 from FreeSimpleGUI import popup_quick_message
 from sql_formatter.core import format_sql
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from tabulate import tabulate
 
 from app.auth.windows import login_required, session_manager
-from app.system.models import engine, Test, LabOrder, Customer, LabOrderItem, User, Doctor
+from app.system.models import engine, Test, LabOrder, Customer, LabOrderItem, User
+from app.system.instrumentation import get_stats, reset_stats, dump_stats
+from app.system.readonly import get_query_engine, refresh_snapshot
+from app.system.queries import load_order_page, load_order_item_rows, load_worklist_rows
+from app.system.simulation.analysis import analyze_pending_items
+from app.system.simulation.events import EventStream, format_summary
+from app.system.simulation.routing import load_pools, format_utilization
+from app.system.simulation.capacity import plan_capacity
+from app.system.simulation.orders import generate_orders
+from app.system.tasks import start_task, format_progress
 from app.config import logger, config_dict, update_config_yaml
 
 
@@ -32,6 +40,19 @@ def create_logging_window():
     window.close()
 
 
+def run_query(task, query, use_snapshot):
+    # Queries run on a read-only connection so that they cannot change or lock the live data.
+    with get_query_engine(use_snapshot).connect() as conn:
+        # Cancelling interrupts the statement inside SQLite.
+        task.on_cancel(conn.connection.driver_connection.interrupt)
+        return pd.read_sql_query(query, con=conn)
+
+
+def run_snapshot_refresh(task):
+    # The backup reads the whole database, so it runs in a worker thread like the queries.
+    return refresh_snapshot()
+
+
 @login_required
 def create_sql_window():
     layout = [
@@ -42,8 +63,10 @@ def create_sql_window():
         [sg.Text('SQL Query')],
         [sg.Multiline(key='-query-', size=(80, 10), expand_y=True, expand_x=True,
                       focus=True, font='Courier 13 bold', text_color='blue')],
-        [sg.Button('Run'), sg.Button('Format'), sg.Button('Save Query', key='-save-query-'),
-         sg.Button('Clear'), sg.Button('Exit')],
+        [sg.Button('Run'), sg.Button('Cancel', key='-cancel-', disabled=True), sg.Button('Format'),
+         sg.Button('Save Query', key='-save-query-'), sg.Button('Clear'), sg.Button('Exit')],
+        [sg.Checkbox('Query a snapshot copy of the database', key='-snapshot-'),
+         sg.Button('Refresh Snapshot', key='-refresh-snapshot-')],
         [sg.Text('Console')],
         [sg.Multiline(key='-console-', size=(80, 5), font='Courier 13 bold', expand_x=True, expand_y=True)]
     ]
@@ -51,10 +74,17 @@ def create_sql_window():
     window = sg.Window('SQL Tools', layout=layout, modal=True, resizable=True)
 
     df = pd.DataFrame()
+    task = None
+    snapshot_task = None
 
     while True:
         event, values = window.read()
+        busy = any(t and t.running for t in (task, snapshot_task))
         if event in ('Exit', sg.WIN_CLOSED):
+            if task:
+                task.stop()
+            if snapshot_task:
+                snapshot_task.stop()
             break
         elif event == 'Format':
             window['-query-'].update(format_sql(values['-query-']))
@@ -83,20 +113,167 @@ def create_sql_window():
             else:
                 sg.PopupQuickMessage('The result data is empty.')
 
-        elif event == 'Run':
-            try:
-                df = pd.read_sql_query(values['-query-'], con=engine)
-            except Exception as e:
-                window['-console-'].update(str(e), text_color_for_value='red')
-                df = pd.DataFrame()
-            else:
+        elif event == '-refresh-snapshot-' and not busy:
+            # Refreshing disposes the snapshot engine, so it never runs at the same time as a query.
+            snapshot_task = start_task(window, '-snapshot-task-', run_snapshot_refresh)
+            window['Run'].update(disabled=True)
+            window['-refresh-snapshot-'].update(disabled=True)
+            window['-console-'].update('Refreshing the snapshot...', text_color_for_value='black')
+        elif isinstance(event, tuple) and event[0] == '-snapshot-task-':
+            window['Run'].update(disabled=False)
+            window['-refresh-snapshot-'].update(disabled=False)
+            if event[1] == 'done':
+                window['-console-'].update('The snapshot has been refreshed.', text_color_for_value='green')
+            elif event[1] == 'error':
+                window['-console-'].update(f'The snapshot could not be refreshed: {values[event]}',
+                                           text_color_for_value='red')
+        elif event == 'Run' and not busy:
+            task = start_task(window, '-query-task-', run_query, values['-query-'], values['-snapshot-'])
+            window['Run'].update(disabled=True)
+            window['-refresh-snapshot-'].update(disabled=True)
+            window['-cancel-'].update(disabled=False)
+            window['-console-'].update('Running...', text_color_for_value='black')
+        elif event == '-cancel-' and task:
+            task.cancel()
+        elif isinstance(event, tuple) and event[0] == '-query-task-':
+            window['Run'].update(disabled=False)
+            window['-refresh-snapshot-'].update(disabled=False)
+            window['-cancel-'].update(disabled=True)
+            if event[1] == 'done':
+                df = values[event]
                 window['-console-'].update(f'Total records = {len(df)}', text_color_for_value='green')
                 window['-table-'].update('')
                 print(tabulate(df, headers='keys', tablefmt='psql'))
+            elif event[1] == 'error':
+                window['-console-'].update(str(values[event]), text_color_for_value='red')
+                df = pd.DataFrame()
+            elif event[1] == 'cancelled':
+                window['-console-'].update('The query has been cancelled.', text_color_for_value='red')
+                df = pd.DataFrame()
 
     window.close()
 
 
+def load_performance_stats():
+    rows = []
+    for name, stats in get_stats().items():
+        rows.append([
+            name,
+            stats['calls'],
+            stats['statements'],
+            f"{stats['total_time'] * 1000:.1f}",
+            f"{stats['total_time'] * 1000 / stats['statements']:.2f}" if stats['statements'] else '',
+            f"{stats['max_time'] * 1000:.2f}",
+            stats['rows'],
+        ])
+    return rows
+
+
+@login_required
+def create_performance_window():
+    layout = [
+        [sg.Table(values=load_performance_stats(),
+                  headings=['Operation', 'Calls', 'Statements', 'Total (ms)', 'Avg (ms)', 'Max (ms)', 'Rows'],
+                  key='-TABLE-', auto_size_columns=True, expand_x=True, expand_y=True,
+                  alternating_row_color='lightblue', font=('Arial', 16))],
+        [sg.Button('Refresh'), sg.Button('Reset', button_color=('white', 'red')),
+         sg.Button('Save JSON', key='-save-json-'), sg.CloseButton('Close')],
+    ]
+    window = sg.Window('Performance', layout=layout, modal=True, resizable=True, finalize=True)
+    while True:
+        event, values = window.read()
+        if event in ('Exit', sg.WIN_CLOSED):
+            break
+        elif event == 'Refresh':
+            window['-TABLE-'].update(values=load_performance_stats())
+        elif event == 'Reset':
+            reset_stats()
+            window['-TABLE-'].update(values=load_performance_stats())
+        elif event == '-save-json-':
+            filepath = sg.popup_get_file('Save the statistics as', save_as=True,
+                                         file_types=(('JSON', '*.json'),), no_window=True)
+            if filepath:
+                if not filepath.endswith('.json'):
+                    filepath += '.json'
+                dump_stats(filepath)
+                sg.PopupQuickMessage('The statistics have been saved.')
+    window.close()
+
+
+def parse_numbers(text, convert=int):
+    return [convert(value) for value in text.replace(',', ' ').split()]
+
+
+def run_capacity_plan(task, staff_counts, analyzer_counts, arrival_rates, replications, num_orders, seed):
+    return plan_capacity(staff_counts, analyzer_counts, arrival_rates, replications=replications,
+                         num_orders=num_orders, seed=seed, progress=task.progress)
+
+
+@login_required
+def create_capacity_window():
+    layout = [
+        [sg.Text('Staff counts:'), sg.Input('1 2 3', key='-STAFF-', size=(20, 1)),
+         sg.Text('Analyzer counts:'), sg.Input(config_dict['num_analyzers'], key='-ANALYZERS-', size=(20, 1)),
+         sg.Text('Orders per hour:'), sg.Input('5 10', key='-RATES-', size=(20, 1))],
+        [sg.Text('Replications:'), sg.Input(100, key='-REPLICATIONS-', size=(8, 1)),
+         sg.Text('Orders per replication:'), sg.Input(500, key='-NUM-ORDERS-', size=(8, 1)),
+         sg.Text('Seed:'), sg.Input('', key='-SEED-', size=(8, 1))],
+        [sg.Table(values=[],
+                  headings=['Staff', 'Analyzers', 'Orders/h', 'TAT p50 (min)', 'TAT p90 (min)', 'TAT p99 (min)',
+                            'Staff Util. (%)', 'Analyzer Util. (%)'],
+                  key='-TABLE-', auto_size_columns=True, expand_x=True, expand_y=True,
+                  alternating_row_color='lightblue', font=('Arial', 16))],
+        [sg.Button('Run', button_color=('white', 'green')), sg.CloseButton('Close'), sg.Help()],
+        progress_row(),
+    ]
+    window = sg.Window('Capacity Planning', layout=layout, modal=True, resizable=True, finalize=True)
+    task = None
+    while True:
+        event, values = window.read()
+        if event in ('Exit', sg.WIN_CLOSED):
+            if task:
+                task.stop()
+            break
+        elif event == 'Run' and not (task and task.running):
+            try:
+                staff_counts = parse_numbers(values['-STAFF-'])
+                analyzer_counts = parse_numbers(values['-ANALYZERS-'])
+                arrival_rates = parse_numbers(values['-RATES-'], float)
+                replications = int(values['-REPLICATIONS-'])
+                num_orders = int(values['-NUM-ORDERS-'])
+                seed = int(values['-SEED-']) if values['-SEED-'] else None
+            except ValueError:
+                sg.popup_error('Please enter whole numbers for the counts, replications and seed.')
+                continue
+            if not (staff_counts and analyzer_counts and arrival_rates) or \
+                    min(staff_counts + analyzer_counts) < 1 or min(arrival_rates) <= 0:
+                sg.popup_error('Counts and arrival rates must be greater than zero.')
+                continue
+            task = start_task(window, '-CAPACITY-TASK-', run_capacity_plan, staff_counts, analyzer_counts,
+                              arrival_rates, replications, num_orders, seed)
+            set_task_running(window, 'Run', True)
+        elif event == '-CANCEL-' and task:
+            task.cancel()
+        elif event == ('-CAPACITY-TASK-', 'progress'):
+            update_progress(window, *values[event])
+        elif event == ('-CAPACITY-TASK-', 'done'):
+            set_task_running(window, 'Run', False)
+            window['-TABLE-'].update(values=[[row['staff'], row['analyzers'], f"{row['arrival_rate']:g}",
+                                              f"{row['p50']:.1f}", f"{row['p90']:.1f}", f"{row['p99']:.1f}",
+                                              f"{row['staff_utilization'] * 100:.1f}",
+                                              f"{row['analyzer_utilization'] * 100:.1f}"] for row in values[event]])
+        elif event == ('-CAPACITY-TASK-', 'error'):
+            set_task_running(window, 'Run', False)
+            sg.popup_error(f'The simulations have failed: {values[event]}')
+        elif event == ('-CAPACITY-TASK-', 'cancelled'):
+            set_task_running(window, 'Run', False)
+        elif event == 'Help':
+            sg.popup_ok('Each combination of staff count, analyzer count and arrival rate is simulated'
+                        ' for the number of replications. TAT is the time from ordering until the last'
+                        ' item of the order is finished.')
+    window.close()
+
+
 def show_save_query_dialog():
     layout = [
         [sg.Input(key='-filepath-'), sg.FileSaveAs('Browse', file_types=(('Excel', 'xlsx'),))],
@@ -394,42 +571,58 @@ def format_datetime(dt, datetime_format='%d/%m/%Y %H:%M:%S'):
     return dt.strftime(datetime_format)
 
 
+def progress_row():
+    return [sg.ProgressBar(100, orientation='h', size=(30, 15), key='-PROGRESS-'),
+            sg.Text('', key='-PROGRESS-TEXT-', size=(40, 1)),
+            sg.Button('Cancel', key='-CANCEL-', disabled=True)]
+
+
+def parse_seed(text):
+    """Return the seed of a run, a new random seed is drawn when the field is empty so that it can be logged."""
+    return int(text) if text.strip() else random.randrange(2 ** 32)
+
+
+def update_progress(window, done, total, message=''):
+    window['-PROGRESS-'].update(current_count=done, max=total or 1)
+    window['-PROGRESS-TEXT-'].update(format_progress(done, total, message))
+
+
+def set_task_running(window, start_key, running):
+    window[start_key].update(disabled=running)
+    window['-CANCEL-'].update(disabled=not running)
+    if not running:
+        window['-PROGRESS-'].update(current_count=0)
+        window['-PROGRESS-TEXT-'].update('')
+
+
+ORDER_PAGE_SIZE = 100
+# Milliseconds between updates of the simulation summary while a task runs.
+SUMMARY_INTERVAL = 250
+
+
+def run_order_generation(task, num_orders, auto_receive, receiver_id, num_staff, seed, stream):
+    with stream:
+        return generate_orders(num_orders, auto_receive=auto_receive, receiver_id=receiver_id,
+                               num_staff=num_staff, rng=random.Random(seed), progress=task.progress,
+                               stream=stream)
+
+
 @login_required
 def create_order_list_window():
+    # The cursor of each page from the newest orders to the current page.
+    page_cursors = [None]
+
     def load_orders():
-        data = []
         with Session(engine) as session:
-            query = select(LabOrder)
-            for order in session.scalars(query):
-                if order.approved_at:
-                    status = 'APPROVED'
-                    status_datetime = format_datetime(order.approved_at)
-                elif order.rejected_at:
-                    status = 'REJECTED'
-                    status_datetime = format_datetime(order.rejected_at)
-                elif order.cancelled_at:
-                    status = 'CANCELLED'
-                    status_datetime = format_datetime(order.cancelled_at)
-                elif order.received_at:
-                    status = 'RECEIVED'
-                    status_datetime = format_datetime(order.received_at)
-                else:
-                    status = 'PENDING'
-                    status_datetime = ''
-
-                data.append([
-                    order.id,
-                    order.customer.hn,
-                    order.customer.fullname,
-                    format_datetime(order.order_datetime) or '',
-                    order.doctor.fullname,
-                    status,
-                    status_datetime,
-                    len(order.order_items),
-                ])
-        return data
-
-    data = load_orders()
+            return load_order_page(session, ORDER_PAGE_SIZE, page_cursors[-1])
+
+    def show_orders():
+        window.find_element('-ORDER-TABLE-').update(values=data)
+        window.find_element('-PAGE-').update(f'Page {len(page_cursors)}')
+        window.find_element('-NEWER-').update(disabled=len(page_cursors) == 1)
+        window.find_element('-OLDER-').update(disabled=next_cursor is None)
+
+    data, next_cursor = load_orders()
 
     layout = [
         [sg.Table(values=data, headings=['ID', 'HN', 'Customer', 'Ordered At',
@@ -442,78 +635,80 @@ def create_order_list_window():
                   enable_events=True,
                   num_rows=20,
                   )],
-        [sg.Text('Number orders:'), sg.Input('1', key='-NUM-ORDERS-')],
+        [sg.Button('< Newer', key='-NEWER-', disabled=True),
+         sg.Text('Page 1', key='-PAGE-'),
+         sg.Button('Older >', key='-OLDER-', disabled=next_cursor is None)],
+        [sg.Text('Number orders:'), sg.Input('1', key='-NUM-ORDERS-'),
+         sg.Text('Seed:'), sg.Input('', key='-SEED-', size=(10, 1))],
         [sg.Checkbox('Auto receive all orders', key='-AUTO-RECEIVE-', enable_events=True)],
         [sg.Button('Get Order', key='-GET-ORDER-'), sg.CloseButton('Close')],
+        progress_row(),
         [sg.Text('Activity Log', font=('Arial', 15, 'bold'))],
-        # [sg.Output(key='-OUTPUT-', size=(75,5), font=('Arial', 15))],
+        [sg.Text('', key='-SUMMARY-', size=(75, 2), font=('Arial', 15))],
     ]
 
     window = sg.Window('Order List', layout=layout, modal=True, resizable=True, finalize=True)
     window['-ORDER-TABLE-'].bind("<Double-Button-1>", " Double")
     window.maximize()
+    task = None
+    stream = None
     while True:
-        event, values = window.read()
+        event, values = window.read(timeout=SUMMARY_INTERVAL if task and task.running else None)
+        if stream:
+            window['-SUMMARY-'].update(format_summary(stream.summary()))
         if event in ('Exit', sg.WIN_CLOSED):
+            if task:
+                task.stop()
             break
         elif event == '-ORDER-TABLE- Double' and values['-ORDER-TABLE-']:
             create_order_item_list_window(data[values['-ORDER-TABLE-'][0]][0])
-            data = load_orders()
-            window.find_element('-ORDER-TABLE-').update(values=data)
-        elif event == '-GET-ORDER-':
+            data, next_cursor = load_orders()
+            show_orders()
+        elif event == '-OLDER-' and next_cursor:
+            page_cursors.append(next_cursor)
+            data, next_cursor = load_orders()
+            show_orders()
+        elif event == '-NEWER-' and len(page_cursors) > 1:
+            page_cursors.pop()
+            data, next_cursor = load_orders()
+            show_orders()
+        elif event == '-GET-ORDER-' and not (task and task.running):
             # TODO: add code to check if the simulations run successfully
+            try:
+                num_orders = int(values['-NUM-ORDERS-'])
+                seed = parse_seed(values['-SEED-'])
+            except ValueError:
+                sg.popup_ok('Please enter whole numbers for the number of orders and the seed.')
+                continue
             with Session(engine) as session:
                 current_user = session.scalar(select(User).where(User.username == session_manager.current_user))
-                query = select(func.count(User.id)).where(User.active == True)
-                doctor_query = select(Doctor).order_by(func.random())
-                num_staff = session.scalar(query)
-                query = select(Customer).order_by(func.random())
-                env = simpy.rt.RealtimeEnvironment(factor=0.1, strict=False)
-                staff = simpy.Resource(env, capacity=num_staff)
-                doctors = session.scalars(select(Doctor)).all()
-                tests = session.scalars(select(Test).where(Test.active == True)).all()
-                records = {}
-                for i in range(int(values['-NUM-ORDERS-'])):
-                    customer = session.scalar(query)
-                    doctor = random.choice(doctors)
-                    if len(tests) == 0:
-                        sg.popup_ok(f"Add some tests first.")
-                        break
-                    order = LabOrder(customer=customer,
-                                     doctor=doctor,
-                                     order_datetime=datetime.datetime.now())
-                    if values['-AUTO-RECEIVE-']:
-                        env.process(run_order_receive(env, order, staff, 1, 5, records))
-                    n = random.randint(1, len(tests))
-                    ordered_items = set()
-                    for test in random.choices(tests, k=n):
-                        if test not in ordered_items:
-                            order_item = LabOrderItem(test=test)
-                            order.order_items.append(order_item)
-                            ordered_items.add(test)
-                    session.add(order)
-                    session.commit()
-                    logger.info(f'LAB ORDER ID={order.id} ORDERED AT {order.order_datetime}')
-                env.run()
-                print('Done.')
-                for order, value in records.items():
-                    t, rejected = value
-                    if not rejected:
-                        order.received_at = order.order_datetime + datetime.timedelta(minutes=t)
-                        order.receiver = current_user
-                        logger.info(f'LAB ORDER ID={order.id} RECEIVED AT {order.received_at}')
-                    else:
-                        order.reason = random.choice(['Improper specimens collection', 'Not enough specimens', 'Tests not available'])
-                        order.rejected_at = order.order_datetime + datetime.timedelta(minutes=t)
-                        order.rejecter = current_user
-                        print(f'Rejected {order.id} because {order.reason}.')
-                        logger.info(f'LAB ORDER ID={order.id} REJECTED AT {order.rejected_at}')
-                    session.add(order)
-                session.commit()
-            data = load_orders()
-            window.find_element('-ORDER-TABLE-').update(values=data)
+                num_staff = session.scalar(select(func.count(User.id)).where(User.active == True))
+            stream = EventStream(servers=num_staff)
+            task = start_task(window, '-GET-ORDER-TASK-', run_order_generation, num_orders,
+                              values['-AUTO-RECEIVE-'], current_user.id, num_staff, seed, stream)
+            set_task_running(window, '-GET-ORDER-', True)
+        elif event == '-CANCEL-' and task:
+            task.cancel()
+        elif event == ('-GET-ORDER-TASK-', 'progress'):
+            update_progress(window, *values[event])
+        elif isinstance(event, tuple) and event[0] == '-GET-ORDER-TASK-':
+            set_task_running(window, '-GET-ORDER-', False)
+            if event[1] == 'error':
+                sg.popup_ok(str(values[event]))
+                continue
+            if event[1] == 'done' and values[event]['order_ids']:
+                result = values[event]
+                logger.info(f'LAB ORDER ID={result["order_ids"][0]}-{result["order_ids"][-1]} ORDERED, '
+                            f'{result["received"]} RECEIVED, {result["rejected"]} REJECTED, SEED {seed}')
+            # New orders are the newest, so go back to the first page to show them.
+            del page_cursors[1:]
+            data, next_cursor = load_orders()
+            show_orders()
             window.refresh()
-            popup_quick_message("Order(s) have arrived.", background_color='lightgreen')
+            if event[1] == 'done':
+                popup_quick_message("Order(s) have arrived.", background_color='lightgreen')
+            else:
+                popup_quick_message("Cancelled, the orders created so far have been kept.")
     window.close()
 
 
@@ -521,23 +716,7 @@ def create_order_list_window():
 def create_order_item_list_window(lab_order_id):
     def load_item_list():
         with Session(engine) as session:
-            query = select(LabOrder).where(LabOrder.id == lab_order_id)
-            order = session.scalar(query)
-            items = []
-            for item in order.order_items:
-                items.append([
-                    item.id,
-                    item.test.code,
-                    item.test.tmlt_name,
-                    item.value_string or '',
-                    format_datetime(item.reported_at) or '',
-                    item.reporter or '',
-                    format_datetime(item.approved_at) or '',
-                    item.approver or '',
-                    format_datetime(item.finished_at) or '',
-                    format_datetime(item.cancelled_at) or '',
-                ])
-            return items
+            return load_order_item_rows(session, lab_order_id)
 
     items = load_item_list()
     with Session(engine) as session:
@@ -968,25 +1147,21 @@ def create_lab_order_item_version_list_window(item_id):
     window.close()
 
 
+def run_analysis(task, pools, seed, stream):
+    with stream:
+        result = analyze_pending_items(sum(pool.count for pool in pools), rng=random.Random(seed),
+                                       progress=task.progress, stream=stream, pools=pools)
+    if result['item_ids']:
+        end_time = result['start_time'] + datetime.timedelta(minutes=stream.now)
+        logger.info(f'{len(result["item_ids"])} LAB ORDER ITEMS FINISHED BETWEEN {result["start_time"]} AND '
+                    f'{end_time}, RUN {stream.run_id}, SEED {seed}')
+    return result
+
+
 @login_required
 def create_analysis_window():
-    items = []
     with Session(engine) as session:
-        query = select(LabOrderItem).where(and_(
-            LabOrderItem.finished_at == None,
-            LabOrderItem.cancelled_at == None)
-        )
-        for item in session.scalars(query):
-            if item.order.received_at:
-                items.append([
-                    item.id,
-                    item.test.code,
-                    item.test.label,
-                    item.test.tmlt_name,
-                    format_datetime(item.order.received_at) or '',
-                    item.order.customer.hn,
-                    item.order.customer.fullname,
-                ])
+        items = load_worklist_rows(session)
     layout = [
         [sg.Table(headings=['ID', 'Code', 'Label', 'TMLT Name', 'Received At', 'HN', 'Patient'],
                   values=items,
@@ -997,70 +1172,65 @@ def create_analysis_window():
                   expand_x=True,
                   enable_events=True)],
         [sg.Text('Analysis Log', font=('Arial', 16, 'bold'))],
-        [sg.Output(key='-OUTPUT-',size=(75, 15), background_color='lightgrey', font=('Arial', 15))],
-        [sg.Text('Number of Analyzers:'), sg.Input(config_dict['num_analyzers'], key='-NUM-INSTRUMENT-')],
+        [sg.Text('', key='-SUMMARY-', size=(75, 3), background_color='lightgrey', font=('Arial', 15))],
+        [sg.Text('', key='-UTILIZATION-', size=(75, max(len(config_dict['analyzers']), 1)), font=('Arial', 15))],
+        [sg.Text('Number of Analyzers:'),
+         sg.Input(config_dict['num_analyzers'], key='-NUM-INSTRUMENT-',
+                  tooltip='Used when no analyzers are configured in config.yaml'),
+         sg.Text('Seed:'), sg.Input('', key='-SEED-', size=(10, 1))],
         [sg.Button('Run', button_color=('white', 'green')),
          sg.CloseButton('Close'),
          sg.Help()],
+        progress_row(),
     ]
 
     window = sg.Window('Analysis', layout=layout, modal=True, resizable=True, finalize=True)
     window.maximize()
 
+    task = None
+    stream = None
     while True:
-        event, values = window.read()
+        event, values = window.read(timeout=SUMMARY_INTERVAL if task and task.running else None)
+        if stream:
+            window['-SUMMARY-'].update(format_summary(stream.summary()))
         if event in ('Exit', sg.WIN_CLOSED):
+            if task:
+                task.stop()
             break
-        elif event == 'Run':
-            with Session(engine) as session:
-                query = select(LabOrderItem).where(and_(
-                    LabOrderItem.finished_at == None,
-                    LabOrderItem.cancelled_at == None)
-                )
-
-                start_time = datetime.datetime.now()
-
-                env = simpy.rt.RealtimeEnvironment(factor=0.1, strict=False)
-                instrument = simpy.Resource(env, capacity=int(values['-NUM-INSTRUMENT-']))
-                records = {}
-                for item in session.scalars(query):
-                    if item.order.received_at:
-                        env.process(run_test(env, item, instrument, 5, 10, records))
-                # staff = simpy.Resource(env, capacity=staff_count)
-                env.run()
-                for item, t in records.items():
-                    item.random_value()
-                    finished_at = start_time + datetime.timedelta(minutes=t)
-                    item.finished_at = finished_at
-                    item.updated_at = finished_at
-                    session.add(item)
-                    logger.info(f'LAB ORDER ID={item.id} FINISHED AT {item.finished_at}')
-                session.commit()
-                if int(config_dict['num_analyzers']) != int(values['-NUM-INSTRUMENT-']):
-                    update_config_yaml(num_analyzers=int(values['-NUM-INSTRUMENT-']))
+        elif event == 'Run' and not (task and task.running):
+            try:
+                num_analyzers = int(values['-NUM-INSTRUMENT-'])
+                seed = parse_seed(values['-SEED-'])
+            except ValueError:
+                sg.popup_ok('Please enter whole numbers for the number of analyzers and the seed.')
+                continue
+            try:
+                pools = load_pools(config_dict['analyzers'], num_analyzers)
+            except (KeyError, TypeError, ValueError) as e:
+                sg.popup_error(f'The analyzers in config.yaml are not valid: {e}')
+                continue
+            stream = EventStream(servers=sum(pool.count * pool.batch_size for pool in pools))
+            window['-UTILIZATION-'].update('')
+            task = start_task(window, '-ANALYSIS-TASK-', run_analysis, pools, seed, stream)
+            set_task_running(window, 'Run', True)
+        elif event == '-CANCEL-' and task:
+            task.cancel()
+        elif event == ('-ANALYSIS-TASK-', 'progress'):
+            update_progress(window, *values[event])
+        elif event == ('-ANALYSIS-TASK-', 'done'):
+            set_task_running(window, 'Run', False)
+            window['-UTILIZATION-'].update(format_utilization(values[event]['utilization']))
+            if int(config_dict['num_analyzers']) != num_analyzers:
+                update_config_yaml(num_analyzers=num_analyzers)
             popup_quick_message("All analyses have finished.", background_color='lightgreen')
+        elif event == ('-ANALYSIS-TASK-', 'error'):
+            set_task_running(window, 'Run', False)
+            sg.popup_error(f'The analyses have failed: {values[event]}')
+        elif event == ('-ANALYSIS-TASK-', 'cancelled'):
+            set_task_running(window, 'Run', False)
+            popup_quick_message("Cancelled, the results saved so far have been kept.")
 
         elif event == 'Help':
             sg.popup_ok('The list shows all test that waiting to be analyzed.'
                         ' If you click run, all tests will be sent to virtual analyzers.')
     window.close()
-
-
-def run_test(env, item, instrument, min_duration, max_duration, records):
-    with instrument.request() as req:
-        print(f'ID={item.id} {item.test.code} waiting to be analyzed...')
-        yield req
-        print(f'Analyzing ID={item.id} {item.test.code}...')
-        yield env.timeout(random.randint(min_duration, max_duration))
-        print(f'ID={item.id} {item.test.code} Done.')
-        # print(print_stats(instrument))
-    records[item] = env.now
-
-
-def run_order_receive(env, order, staff, min_duration, max_duration, records):
-    with staff.request() as req:
-        yield req
-        rejected = random.choices([True, False], weights=[0.05, 0.95], k=1)
-        print(f'Receiving order {order.id}...')
-        yield env.timeout(random.randint(min_duration, max_duration))
-    records[order] = (env.now, rejected[0])
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""Check the array queueing kernel against the simpy model and time both.
+
+Run from the repository root:
+
+    python -m benchmarks.analysis_kernel --sizes 10000 100000 1000000 --analyzers 1 4
+
+For every size and number of analyzers the kernel and simpy are given the same
+seed, the finish times must be identical. The schedule column times
+simulate_routed_analysis with one pool of analyzers, the path the analysis
+window and jobs use, which draws the durations and computes the lazy timeline.
+The events column times reading all of its events afterwards. simpy is only
+timed up to --max-simpy items because it creates a process per item and
+simpy.PriorityResource sorts its queue on every request.
+"""
+import argparse
+import random
+import time
+
+from app.system.simulation.routing import load_pools, simulate_routed_analysis, ROUTINE
+
+
+def finish_times(timeline):
+    return {event.id: event.time for event in timeline if event.kind == 'finished'}
+
+
+def compare(num_items, num_analyzers, seed, run_simpy):
+    items = [(i, 'TEST', None, ROUTINE) for i in range(num_items)]
+    pools = load_pools([], num_analyzers)
+    started = time.perf_counter()
+    kernel, _ = simulate_routed_analysis(items, pools, rng=random.Random(seed))
+    kernel_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in kernel:
+        pass
+    events_time = time.perf_counter() - started
+    if not run_simpy:
+        return kernel_time, events_time, None, None
+    started = time.perf_counter()
+    # An event callback forces the simpy model.
+    reference, _ = simulate_routed_analysis(items, pools, rng=random.Random(seed), on_event=lambda event: None)
+    simpy_time = time.perf_counter() - started
+    return kernel_time, events_time, simpy_time, finish_times(kernel) == finish_times(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis queueing kernel.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--analyzers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--max-simpy', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f'{"items":>10} {"analyzers":>9} {"schedule":>10} {"events":>10} {"simpy":>10} {"same":>6}')
+    for size in args.sizes:
+        for num_analyzers in args.analyzers:
+            kernel_time, events_time, simpy_time, same = compare(size, num_analyzers, args.seed,
+                                                                 size <= args.max_simpy)
+            simpy_text = f'{simpy_time:9.3f}s' if simpy_time is not None else f'{"-":>10}'
+            same_text = str(same) if same is not None else '-'
+            print(f'{size:>10,} {num_analyzers:>9} {kernel_time:9.3f}s {events_time:9.3f}s {simpy_text} {same_text:>6}')
+
+
+if __name__ == '__main__':
+    main()
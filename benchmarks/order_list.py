@@ -0,0 +1,93 @@
+"""Compare the old per-order lazy loading of the order list with load_order_rows.
+
+Run from the repository root:
+
+    python -m benchmarks.order_list --sizes 1000 10000 50000
+
+Each size is loaded into a fresh temporary database. The lazy-loading loader is
+only timed up to --max-lazy orders because it issues three SELECTs per order.
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import insert, select, event
+from sqlalchemy.orm import Session
+
+from app.system.models import create_db_engine, Base, Customer, Doctor, LabOrder, LabOrderItem, refresh_order_summary
+from app.system.queries import load_order_rows
+
+
+def populate(engine, num_orders, items_per_order=3):
+    # Items only need a test id to be counted, the tests table itself is not read by either loader.
+    now = datetime.datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(Customer), [
+            {'id': i, 'hn': str(i), 'firstname': 'First', 'lastname': f'Last{i}',
+             'gender': 'female', 'dob': datetime.date(1980, 1, 1), 'address': ''}
+            for i in range(1, 1001)
+        ])
+        conn.execute(insert(Doctor), [
+            {'id': i, 'fullname': f'Doctor {i}', 'license_number': str(i), 'gender': 'male'}
+            for i in range(1, 11)
+        ])
+        conn.execute(insert(LabOrder), [
+            {'id': i, 'customer_id': random.randint(1, 1000), 'doctor_id': random.randint(1, 10),
+             'order_datetime': now - datetime.timedelta(minutes=i),
+             'received_at': now if i % 2 else None}
+            for i in range(1, num_orders + 1)
+        ])
+        conn.execute(insert(LabOrderItem.__table__), [
+            {'order_id': i, 'test_id': t}
+            for i in range(1, num_orders + 1) for t in range(1, items_per_order + 1)
+        ])
+        refresh_order_summary(conn)
+
+
+def load_orders_lazily(session):
+    data = []
+    for order in session.scalars(select(LabOrder)):
+        data.append([order.id, order.customer.hn, order.customer.fullname, order.order_datetime,
+                     order.doctor.fullname, order.received_at, len(order.order_items)])
+    return data
+
+
+def measure(engine, loader):
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(engine, 'before_cursor_execute', listener)
+    start = time.perf_counter()
+    with Session(engine) as session:
+        rows = loader(session)
+    elapsed = time.perf_counter() - start
+    event.remove(engine, 'before_cursor_execute', listener)
+    return elapsed, len(statements), len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000, 50000])
+    parser.add_argument('--max-lazy', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f'{"orders":>8} {"loader":>10} {"seconds":>9} {"queries":>9}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine = create_db_engine(f'sqlite:///{os.path.join(tmpdir, "bench.db")}')
+            Base.metadata.create_all(engine)
+            populate(engine, size)
+            loaders = [('sql', load_order_rows)]
+            if size <= args.max_lazy:
+                loaders.append(('lazy', load_orders_lazily))
+            for name, loader in loaders:
+                elapsed, num_queries, num_rows = measure(engine, loader)
+                assert num_rows == size
+                print(f'{size:>8} {name:>10} {elapsed:>9.3f} {num_queries:>9}')
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
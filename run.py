@@ -1,4 +1,8 @@
+import multiprocessing
+
 from app.main import run_app
 
 if __name__ == '__main__':
-    run_app()
\ No newline at end of file
+    # The capacity planner runs its simulations in worker processes.
+    multiprocessing.freeze_support()
+    run_app()
@@ -0,0 +1,27 @@
+import datetime
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.config writes config.yaml and run_log.txt to the working directory when it is imported.
+os.chdir(tempfile.mkdtemp(prefix='labtycoon-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from app.system.models import Base  # noqa: E402
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "test.db"}')
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def now():
+    return datetime.datetime(2026, 1, 1, 8, 0)
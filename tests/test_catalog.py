@@ -0,0 +1,38 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.system import models
+from app.system.catalog import import_tests
+
+
+def catalog_row(code, tmlt_code, loinc_no):
+    return {'code': code, 'tmlt_code': tmlt_code, 'tmlt_name': f'{code} test', 'loinc_no': loinc_no,
+            'label': code, 'scale': 'Quantitative', 'specimens': 'Serum', 'method': 'Enzymatic', 'unit': 'mg/dL',
+            'order_type': 'Order', 'price': '100'}
+
+
+def test_import_tests(db_engine):
+    report = import_tests([catalog_row('GLU', 'T1', 'L1'), catalog_row('HBA1C', 'T2', 'L2')], bind=db_engine)
+    assert report == {'inserted': 2, 'updated': 0, 'errors': []}
+
+    rows = [catalog_row('GLU', 'T1', 'L1') | {'price': '120'}, catalog_row('BUN', '', 'L3')]
+    report = import_tests(rows, bind=db_engine)
+    assert report == {'inserted': 1, 'updated': 1, 'errors': []}
+    with Session(db_engine) as session:
+        assert session.scalar(select(models.Test.price).where(models.Test.code == 'GLU')) == 120
+
+
+def test_import_tests_new_rows_with_the_same_tmlt_code(db_engine):
+    rows = [catalog_row('A', 'T1', 'L1'), catalog_row('B', 'T1', 'L2'), catalog_row('C', 'T3', 'L3')]
+    report = import_tests(rows, bind=db_engine)
+    assert report == {'inserted': 2, 'updated': 0, 'errors': [(2, 'TMLT code T1 is used by another row')]}
+    with Session(db_engine) as session:
+        assert session.scalars(select(models.Test.code).order_by(models.Test.code)).all() == ['A', 'C']
+
+
+def test_import_tests_invalid_rows(db_engine):
+    rows = [catalog_row('A', 'T1', 'L1') | {'price': 'free'}, catalog_row('A', 'T2', 'L2'),
+            catalog_row('A', 'T3', 'L3'), catalog_row('B', 'T4', 'L2')]
+    report = import_tests(rows, bind=db_engine)
+    assert report['inserted'] == 1
+    assert [row_no for row_no, _ in report['errors']] == [1, 3, 4]
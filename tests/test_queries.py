@@ -0,0 +1,98 @@
+import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.system import models
+from app.system.models import Customer, LabOrder, LabOrderItem
+from app.system.queries import order_api_rows_query, customer_rows_query, order_item_rows_query, to_json_row
+
+
+def make_customer(hn):
+    return Customer(hn=hn, firstname='Jane', lastname=f'Doe {hn}', gender='F', dob=datetime.date(1990, 1, 1),
+                    address='Bangkok')
+
+
+def add_test(session, code):
+    # Test() saves itself to the app database, so the row is inserted directly.
+    specimens = models.Specimens(label='Serum')
+    method = models.TestMethod(method='Enzymatic')
+    session.add_all([specimens, method])
+    session.flush()
+    return session.scalar(insert(models.Test)
+                          .values(code=code, tmlt_name=code, loinc_no=code, label=code, scale='Quantitative',
+                                  unit='mg/dL', order_type='Order', specimens_id=specimens.id, method_id=method.id)
+                          .returning(models.Test.id))
+
+
+def add_orders(engine, order_datetimes):
+    with Session(engine) as session:
+        customer = make_customer('0001')
+        session.add_all([LabOrder(customer=customer, order_datetime=order_datetime)
+                         for order_datetime in order_datetimes])
+        session.commit()
+
+
+def test_order_api_rows_pages(db_engine, now):
+    # Orders made at the same time are ordered by their id.
+    add_orders(db_engine, [now, now, now + datetime.timedelta(minutes=1), now - datetime.timedelta(minutes=1), now])
+    page_size = 2
+    pages = []
+    cursor = None
+    with Session(db_engine) as session:
+        while True:
+            rows = session.execute(order_api_rows_query(cursor=cursor).limit(page_size + 1)).all()
+            pages.append([row.id for row in rows[:page_size]])
+            if len(rows) <= page_size:
+                break
+            cursor = (rows[page_size - 1].order_datetime, rows[page_size - 1].id)
+        all_ids = [row.id for row in session.execute(order_api_rows_query())]
+    assert pages == [[3, 5], [2, 1], [4]]
+    assert sum(pages, []) == all_ids
+
+
+def test_order_api_rows_cursor_with_filters(db_engine, now):
+    add_orders(db_engine, [now - datetime.timedelta(days=1), now, now + datetime.timedelta(minutes=1)])
+    with Session(db_engine) as session:
+        query = order_api_rows_query(statuses=['PENDING'], start=now,
+                                     cursor=(now + datetime.timedelta(minutes=1), 3))
+        assert [row.id for row in session.execute(query)] == [2]
+
+
+def test_customer_history(db_engine, now):
+    with Session(db_engine) as session:
+        glucose_id = add_test(session, 'GLU')
+        customers = [make_customer('0001'), make_customer('0002')]
+        for customer in customers:
+            for days in (2, 1):
+                received_at = now - datetime.timedelta(days=days)
+                session.add(LabOrder(customer=customer, order_datetime=received_at, received_at=received_at,
+                                     order_items=[LabOrderItem(test_id=glucose_id, _value=str(100 + days),
+                                                               finished_at=received_at)]))
+        session.commit()
+        customer_id = customers[1].id
+
+        # The queries of CustomerResource.get, /customers/<id>/orders/
+        customer = session.execute(customer_rows_query(customer_id=customer_id)).one_or_none()
+        items = [to_json_row(row) for row in session.execute(order_item_rows_query(customer_id=customer_id))]
+        latest = session.execute(order_item_rows_query(customer_id=customer_id, latest=True)).all()
+        missing = session.execute(customer_rows_query(customer_id=customer_id + 1)).one_or_none()
+    assert to_json_row(customer)['hn'] == '0002'
+    assert [item['order_id'] for item in items] == [3, 4]
+    assert [item['value'] for item in items] == [102.0, 101.0]
+    assert [(row.order_id, row.value) for row in latest] == [(4, 101.0)]
+    assert missing is None
+
+
+def test_order_item_rows_values(db_engine, now):
+    with Session(db_engine) as session:
+        glucose_id = add_test(session, 'GLU')
+        values = ['12', '12.5', '<5', '12 H', 'Positive', '', None]
+        session.add(LabOrder(customer=make_customer('0001'), order_datetime=now, received_at=now,
+                             order_items=[LabOrderItem(test_id=glucose_id, _value=value) for value in values]))
+        session.commit()
+        rows = session.execute(order_item_rows_query(['value', 'value_string'])).all()
+    # Only numbers are converted, like LabOrderItem.value, the other results are returned as they were saved.
+    assert [row.value for row in rows] == [12.0, 12.5, '<5', '12 H', 'Positive', '', None]
+    assert [row.value_string for row in rows] == ['12 mg/dL', '12.5 mg/dL', '<5 mg/dL', '12 H mg/dL',
+                                                  'Positive mg/dL', 'N/A', 'N/A']
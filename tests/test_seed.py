@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+from app.system.seed import draw_items
+
+
+@pytest.mark.parametrize('num_orders, num_items, num_tests', [(3000, 9000, 6), (10, 60, 6), (5, 0, 3)])
+def test_draw_items(num_orders, num_items, num_tests):
+    item_orders, item_tests = draw_items(np.random.default_rng(42), num_orders, num_items, num_tests)
+    assert len(item_orders) == len(item_tests) == num_items
+    assert len(np.unique(item_orders * num_tests + item_tests)) == num_items
+    assert np.all(np.diff(item_orders) >= 0)
+    assert np.all((0 <= item_tests) & (item_tests < num_tests))
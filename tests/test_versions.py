@@ -0,0 +1,46 @@
+import datetime
+import os
+import subprocess
+import sys
+import textwrap
+
+from sqlalchemy.orm import Session
+
+from app.system.models import Customer
+from app.system.versions import table_versions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_table_versions_change_on_commit(db_engine):
+    with Session(db_engine) as session:
+        assert table_versions(session, 'customers', 'users') == ('0.0', None)
+        session.add(Customer(hn='0001', firstname='Jane', lastname='Doe', gender='F', dob=datetime.date(1990, 1, 1),
+                             address='Bangkok'))
+        session.flush()
+        session.rollback()
+        assert table_versions(session, 'customers', 'users') == ('0.0', None)
+        session.add(Customer(hn='0001', firstname='Jane', lastname='Doe', gender='F', dob=datetime.date(1990, 1, 1),
+                             address='Bangkok'))
+        session.commit()
+        etag, last_modified = table_versions(session, 'customers', 'users')
+    assert etag == '1.0'
+    assert last_modified is not None
+
+
+def test_table_versions_change_in_another_process(db_engine, tmp_path):
+    with Session(db_engine) as session:
+        before, _ = table_versions(session, 'tests', 'test_methods', 'specimens')
+    # The catalog import of user-005 run as a separate process, like the command line tool.
+    code = textwrap.dedent(f'''
+        from sqlalchemy import create_engine
+        from app.system.catalog import import_tests
+        row = {{'code': 'GLU', 'tmlt_name': 'Glucose', 'loinc_no': 'L1', 'label': 'GLU', 'scale': 'Quantitative',
+               'specimens': 'Serum', 'method': 'Enzymatic', 'unit': 'mg/dL', 'order_type': 'Order'}}
+        print(import_tests([row], bind=create_engine({str(db_engine.url)!r})))
+    ''')
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env={**os.environ, 'PYTHONPATH': ROOT}, check=True)
+    with Session(db_engine) as session:
+        after, _ = table_versions(session, 'tests', 'test_methods', 'specimens')
+    assert before == '0.0.0'
+    assert after == '1.1.1'